@@ -1 +1,8 @@
-from . participant_driven_calibration import Participant_Driven_Screen_Marker_Calibration
\ No newline at end of file
+# participant_driven_calibration is imported when the plugin is activated
+from lazy_plugin import lazy_plugin
+Participant_Driven_Screen_Marker_Calibration = lazy_plugin(
+    '.participant_driven_calibration',
+    'Participant_Driven_Screen_Marker_Calibration',
+    base='calibration_routines.calibration_plugin_base.Calibration_Plugin',
+    package=__name__,
+)
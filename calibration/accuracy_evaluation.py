@@ -0,0 +1,236 @@
+# -*- coding: utf-8 -*-
+'''
+  Pupil Player Third Party Plugins by cpicanco
+  Copyright (C) 2016 Rafael Picanço.
+
+  The present file is distributed under the terms of the GNU General Public License (GPL v3.0).
+
+  You should have received a copy of the GNU General Public License
+  along with this program. If not, see <http://www.gnu.org/licenses/>.
+'''
+
+import numpy as np
+
+from .calibration_samples import Running_Stats, Sample_Buffer
+
+# unit vectors of the reference samples in world camera coordinates
+REF_DIRECTION_DTYPE = np.dtype([
+    ('timestamp', 'f8'),
+    ('site', 'i2'),
+    ('direction', 'f8', (3,)),
+])
+
+def unproject(intrinsics, norm_pos):
+    """
+    intrinsics : world camera model with unprojectPoints
+
+    returns (n, 3) unit vectors of normalized world positions (y up)
+    """
+    norm_pos = np.asarray(norm_pos, dtype=np.float64).reshape(-1, 2)
+    width, height = intrinsics.resolution
+    pixels = np.column_stack((norm_pos[:, 0] * width, (1. - norm_pos[:, 1]) * height))
+    return intrinsics.unprojectPoints(pixels, normalize=True)
+
+def _angles(a, b):
+    """
+    degrees between rows of unit vectors
+    """
+    return np.degrees(np.arccos(np.clip((a * b).sum(axis=1), -1., 1.)))
+
+class Site_Accuracy(object):
+    """
+    Running angular accuracy and precision of the gaze matched to the
+    references of one site, the way Pupil's Accuracy_Visualizer computes
+    them: accuracy is the mean angle between gaze and reference without
+    outliers, precision the RMS angle between successive inlier samples
+    closer than the succession threshold.
+    """
+    def __init__(self, site):
+        self.site = site
+        self.samples = 0
+        self.outliers = 0
+        self.flagged = False
+        self.errors = Running_Stats(dims=1)
+        self._succession_sum_sq = 0.
+        self._successions = 0
+        self._last_direction = None
+
+    def update(self, errors, directions, outlier_threshold, succession_threshold):
+        """
+        errors : degrees from the reference, directions : unit gaze vectors,
+        both in time order
+        """
+        inliers = errors <= outlier_threshold
+        self.samples += len(errors)
+        self.outliers += int(len(errors) - inliers.sum())
+        self.errors.update(errors[inliers])
+
+        directions = directions[inliers]
+        if self._last_direction is not None:
+            directions = np.vstack((self._last_direction, directions))
+        if len(directions):
+            self._last_direction = directions[-1:]
+        if len(directions) > 1:
+            steps = _angles(directions[1:], directions[:-1])
+            steps = steps[steps < succession_threshold]
+            self._succession_sum_sq += float((steps**2).sum())
+            self._successions += len(steps)
+
+    @property
+    def accuracy(self):
+        return float(self.errors.mean[0]) if self.errors.n else np.nan
+
+    @property
+    def precision(self):
+        return float(np.sqrt(self._succession_sum_sq / self._successions)) if self._successions else np.nan
+
+    @property
+    def outlier_fraction(self):
+        return self.outliers / self.samples if self.samples else 0.
+
+    def result(self):
+        return {
+            'site': self.site,
+            'samples': self.samples,
+            'outliers': self.outliers,
+            'accuracy': self.accuracy,
+            'precision': self.precision,
+            'flagged': self.flagged,
+        }
+
+class Accuracy_Evaluator(object):
+    """
+    Matches gaze to the reference samples of an accuracy test while they
+    arrive and keeps the running accuracy and precision of every site.
+
+    Gaze waits until no later reference can be closer to it, then it is
+    matched by searchsorted on the reference timestamps, a batch at a
+    time. Gaze further than max_dispersion seconds from every reference
+    is not used.
+
+    intrinsics : world camera, unprojects normalized positions
+    outlier_threshold : degrees, larger errors are outliers
+    succession_threshold : degrees, larger steps between successive
+        samples are not used for the precision
+    max_outlier_fraction : a site with more outliers is flagged
+    min_samples : gaze samples before a site can be flagged
+    """
+    def __init__(
+            self, intrinsics,
+            max_dispersion=1/15.,
+            outlier_threshold=5.,
+            succession_threshold=.5,
+            max_outlier_fraction=.5,
+            min_samples=10
+        ):
+        self.intrinsics = intrinsics
+        self.max_dispersion = max_dispersion
+        self.outlier_threshold = outlier_threshold
+        self.succession_threshold = succession_threshold
+        self.max_outlier_fraction = max_outlier_fraction
+        self.min_samples = min_samples
+        self.refs = Sample_Buffer(REF_DIRECTION_DTYPE, capacity=1024)
+        self.sites = []
+        self._site_index = {}
+        self._pending_timestamps = np.empty(0)
+        self._pending_norm_pos = np.empty((0, 2))
+        self.unmatched = 0
+
+    def add_ref(self, ref, site):
+        """
+        ref : dict with norm_pos and timestamp, in time order
+        site : the site the marker was shown at
+        """
+        index = self._site_index.get(site)
+        if index is None:
+            index = self._site_index[site] = len(self.sites)
+            self.sites.append(Site_Accuracy(site))
+        self.refs.append((ref['timestamp'], index, unproject(self.intrinsics, ref['norm_pos'])[0]))
+
+    def add_gaze(self, gaze):
+        """
+        gaze : gaze datums, the confidence is not checked here
+        """
+        if not gaze:
+            return
+        self._pending_timestamps = np.concatenate((self._pending_timestamps, [g['timestamp'] for g in gaze]))
+        self._pending_norm_pos = np.vstack((self._pending_norm_pos, [g['norm_pos'] for g in gaze]))
+
+    def update(self, timestamp):
+        """
+        timestamp : current world time, a later reference has a later
+            timestamp
+
+        returns the sites flagged by this update
+        """
+        last_ref = self.refs['timestamp'][-1] if len(self.refs) else -np.inf
+        ready = (self._pending_timestamps <= last_ref) | (self._pending_timestamps < timestamp - self.max_dispersion)
+        if not ready.any():
+            return []
+        timestamps, norm_pos = self._pending_timestamps[ready], self._pending_norm_pos[ready]
+        self._pending_timestamps = self._pending_timestamps[~ready]
+        self._pending_norm_pos = self._pending_norm_pos[~ready]
+        return self._match(timestamps, norm_pos)
+
+    def _match(self, timestamps, norm_pos):
+        ref_timestamps = self.refs['timestamp']
+        if not len(ref_timestamps):
+            self.unmatched += len(timestamps)
+            return []
+        order = np.argsort(timestamps, kind='stable')
+        timestamps, norm_pos = timestamps[order], norm_pos[order]
+
+        # nearest reference, the one before or the one after
+        after = np.clip(np.searchsorted(ref_timestamps, timestamps), 1, len(ref_timestamps) - 1)
+        before = after - 1
+        if len(ref_timestamps) == 1:
+            nearest = np.zeros(len(timestamps), dtype=np.intp)
+        else:
+            closer_before = timestamps - ref_timestamps[before] < ref_timestamps[after] - timestamps
+            nearest = np.where(closer_before, before, after)
+        matched = np.abs(ref_timestamps[nearest] - timestamps) <= self.max_dispersion
+        self.unmatched += int(len(matched) - matched.sum())
+        if not matched.any():
+            return []
+        nearest = nearest[matched]
+        directions = unproject(self.intrinsics, norm_pos[matched])
+        errors = _angles(directions, self.refs['direction'][nearest])
+        site_indices = self.refs['site'][nearest]
+
+        flagged = []
+        for index in np.unique(site_indices):
+            in_site = site_indices == index
+            site = self.sites[index]
+            site.update(errors[in_site], directions[in_site], self.outlier_threshold, self.succession_threshold)
+            if (not site.flagged and site.samples >= self.min_samples
+                    and site.outlier_fraction > self.max_outlier_fraction):
+                site.flagged = True
+                flagged.append(site)
+        return flagged
+
+    def finish(self):
+        """
+        matches the gaze still waiting and returns the results
+        """
+        flagged = self._match(self._pending_timestamps, self._pending_norm_pos)
+        self._pending_timestamps = np.empty(0)
+        self._pending_norm_pos = np.empty((0, 2))
+        return self.results(), flagged
+
+    def results(self):
+        """
+        returns a dict with the accuracy and precision of all sites together
+        and a list with the result of every site
+        """
+        inliers = sum(site.errors.n for site in self.sites)
+        error_sum = sum(site.errors.n * site.accuracy for site in self.sites if site.errors.n)
+        sum_sq = sum(site._succession_sum_sq for site in self.sites)
+        successions = sum(site._successions for site in self.sites)
+        return {
+            'accuracy': error_sum / inliers if inliers else np.nan,
+            'precision': float(np.sqrt(sum_sq / successions)) if successions else np.nan,
+            'samples': sum(site.samples for site in self.sites),
+            'outliers': sum(site.outliers for site in self.sites),
+            'unmatched': self.unmatched,
+            'sites': [site.result() for site in self.sites],
+        }
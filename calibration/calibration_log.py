@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+'''
+  Pupil Player Third Party Plugins by cpicanco
+  Copyright (C) 2016 Rafael Picanço.
+
+  The present file is distributed under the terms of the GNU General Public License (GPL v3.0).
+
+  You should have received a copy of the GNU General Public License
+  along with this program. If not, see <http://www.gnu.org/licenses/>.
+'''
+
+import glob
+import os
+from time import strftime
+
+import msgpack
+
+#logging
+import logging
+logger = logging.getLogger(__name__)
+
+LOG_VERSION = 1
+LOG_EXTENSION = '.calibration_log'
+
+def _to_builtin(obj):
+    # numpy scalars and arrays
+    if hasattr(obj, 'tolist'):
+        return obj.tolist()
+    raise TypeError("Can not log {!r}".format(obj))
+
+class Calibration_Log_Writer(object):
+    """
+    Append-only msgpack log of one calibration session. Every record is
+    a [topic, payload] pair written as it arrives, buffered writes reach
+    the file once per world frame with flush(). A crash loses at most the
+    last frame, a cut last record is skipped by load_calibration_log.
+
+    Topics:
+        session : dict with mode, version and start time
+        ref : reference dict
+        pupil : msgpack encoded pupil datum
+        end : dict, written when the session finished normally
+    """
+    def __init__(self, path, mode):
+        self.path = path
+        self._packer = msgpack.Packer(use_bin_type=True, default=_to_builtin)
+        self._file = open(path, 'ab')
+        self._write('session', {'mode': mode, 'version': LOG_VERSION, 'start': strftime('%Y-%m-%d %H:%M:%S')})
+        self.flush()
+
+    def _write(self, topic, payload):
+        self._file.write(self._packer.pack([topic, payload]))
+
+    def write_ref(self, ref):
+        self._write('ref', ref)
+
+    def write_pupil(self, datum):
+        # serialized pupil data from the ipc keeps its msgpack bytes
+        serialized = getattr(datum, 'serialized', None)
+        if serialized is None:
+            serialized = msgpack.packb(dict(datum), use_bin_type=True, default=_to_builtin)
+        self._write('pupil', serialized)
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self, completed=True):
+        if self._file.closed:
+            return
+        if completed:
+            self._write('end', {'completed': True})
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+
+def calibration_log_path(log_dir, mode):
+    return os.path.join(log_dir, '{}_{}{}'.format(mode, strftime('%Y%m%d_%H%M%S'), LOG_EXTENSION))
+
+def latest_calibration_log(log_dir):
+    logs = glob.glob(os.path.join(log_dir, '*' + LOG_EXTENSION))
+    return max(logs, key=os.path.getmtime) if logs else None
+
+def load_calibration_log(path):
+    """
+    returns a dict with mode, completed, ref_list and pupil_list in the
+    form finish_calibration expects
+    """
+    session = {'mode': None, 'completed': False, 'ref_list': [], 'pupil_list': []}
+    with open(path, 'rb') as log_file:
+        unpacker = msgpack.Unpacker(log_file, raw=False, use_list=False)
+        try:
+            for topic, payload in unpacker:
+                if topic == 'pupil':
+                    session['pupil_list'].append(msgpack.unpackb(payload, raw=False, use_list=False))
+                elif topic == 'ref':
+                    session['ref_list'].append(dict(payload))
+                elif topic == 'session':
+                    session['mode'] = payload['mode']
+                elif topic == 'end':
+                    session['completed'] = True
+        except (ValueError, msgpack.UnpackException) as err:
+            # a record cut by a crash, everything before it is usable
+            logger.warning("Calibration log {} ends with a broken record: {}".format(path, err))
+    return session
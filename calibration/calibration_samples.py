@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+'''
+  Pupil Player Third Party Plugins by cpicanco
+  Copyright (C) 2016 Rafael Picanço.
+
+  The present file is distributed under the terms of the GNU General Public License (GPL v3.0).
+
+  You should have received a copy of the GNU General Public License
+  along with this program. If not, see <http://www.gnu.org/licenses/>.
+'''
+
+from collections import deque
+
+import numpy as np
+
+REF_DTYPE = np.dtype([
+    ('timestamp', 'f8'),
+    ('norm_pos', 'f8', (2,)),
+    ('screen_pos', 'f8', (2,)),
+])
+
+class Sample_Buffer(object):
+    """
+    Growable columnar buffer, rows are stored in a preallocated structured
+    array that doubles its capacity when full.
+    """
+    def __init__(self, dtype, capacity=1024):
+        self._data = np.empty(capacity, dtype=dtype)
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def __getitem__(self, column):
+        """
+        returns a view of the filled part of the column
+        """
+        return self._data[column][:self._size]
+
+    @property
+    def data(self):
+        return self._data[:self._size]
+
+    def _reserve(self, size):
+        if size > len(self._data):
+            grown = np.empty(max(size, 2 * len(self._data)), dtype=self._data.dtype)
+            grown[:self._size] = self._data[:self._size]
+            self._data = grown
+
+    def append(self, row):
+        """
+        row : tuple in dtype field order
+        """
+        self._reserve(self._size + 1)
+        self._data[self._size] = row
+        self._size += 1
+
+    def extend(self, rows):
+        rows = np.asarray(rows, dtype=self._data.dtype)
+        self._reserve(self._size + len(rows))
+        self._data[self._size:self._size + len(rows)] = rows
+        self._size += len(rows)
+
+class Calibration_Samples(object):
+    """
+    Reference and pupil samples of one calibration session. References
+    are stored in columns, pupils as the datums finish_calibration takes.
+
+    Only pupil samples within window seconds of a reference sample are
+    kept. Pupils wait in a pending queue until a reference arrives or
+    they fall out of the window, then they are dropped or, with
+    outside_stride > 0, one of every outside_stride is kept.
+
+    log : optional Calibration_Log_Writer, receives every kept sample
+    """
+    def __init__(self, window=1., outside_stride=0, log=None):
+        self.window = window
+        self.outside_stride = outside_stride
+        self.log = log
+        self.refs = Sample_Buffer(REF_DTYPE, capacity=1024)
+        self.pupils = []
+        self._pending = deque()
+        self._last_ref_timestamp = -np.inf
+        self._outside_count = 0
+        self.dropped = 0
+
+    def add_ref(self, ref):
+        """
+        ref : dict with norm_pos, screen_pos and timestamp
+        """
+        timestamp = ref['timestamp']
+        self.refs.append((timestamp, ref['norm_pos'], ref['screen_pos']))
+        if self.log is not None:
+            self.log.write_ref(ref)
+        self._last_ref_timestamp = max(self._last_ref_timestamp, timestamp)
+        # pupils that came before the reference but are close enough
+        self._expire_pending(timestamp)
+        while self._pending:
+            self._commit(self._pending.popleft())
+
+    def add_pupil(self, datum):
+        """
+        datum : pupil datum, confidence is not checked here
+        """
+        timestamp = datum['timestamp']
+        if timestamp <= self._last_ref_timestamp + self.window:
+            self._commit(datum)
+        else:
+            self._pending.append(datum)
+            self._expire_pending(timestamp)
+
+    def _expire_pending(self, timestamp):
+        while self._pending and self._pending[0]['timestamp'] < timestamp - self.window:
+            datum = self._pending.popleft()
+            self._outside_count += 1
+            if self.outside_stride and self._outside_count % self.outside_stride == 0:
+                self._commit(datum)
+            else:
+                self.dropped += 1
+
+    def _commit(self, datum):
+        self.pupils.append(datum)
+        if self.log is not None:
+            self.log.write_pupil(datum)
+
+    def ref_list(self):
+        """
+        returns the reference dicts finish_calibration expects
+        """
+        refs = self.refs.data
+        return [
+            {'timestamp': timestamp, 'norm_pos': tuple(norm_pos), 'screen_pos': tuple(screen_pos)}
+            for timestamp, norm_pos, screen_pos in zip(
+                refs['timestamp'].tolist(), refs['norm_pos'].tolist(), refs['screen_pos'].tolist()
+            )
+        ]
+
+    def pupil_list(self):
+        """
+        returns the kept pupil datums, pending pupils arrived after the last
+        reference left its window and are not part of the session
+        """
+        return list(self.pupils)
+
+class Running_Stats(object):
+    """
+    Welford running mean and variance of points. A batch is reduced to
+    its own mean and squared deviations and merged with Chan's update.
+    """
+    def __init__(self, dims=2):
+        self.n = 0
+        self.mean = np.zeros(dims)
+        self._m2 = np.zeros(dims)
+
+    def update(self, points):
+        points = np.asarray(points, dtype=np.float64).reshape(-1, len(self.mean))
+        n = len(points)
+        if not n:
+            return
+        mean = points.mean(axis=0)
+        m2 = ((points - mean)**2).sum(axis=0)
+        delta = mean - self.mean
+        total = self.n + n
+        self.mean += delta * n / total
+        self._m2 += m2 + delta**2 * self.n * n / total
+        self.n = total
+
+    @property
+    def variance(self):
+        if self.n < 2:
+            return np.full(len(self.mean), np.inf)
+        return self._m2 / (self.n - 1)
+
+    @property
+    def standard_error(self):
+        """
+        radius of the standard error of the mean
+        """
+        if self.n < 2:
+            return np.inf
+        return float(np.sqrt(self.variance.sum() / self.n))
+
+class Site_Convergence(object):
+    """
+    Running statistics of the reference and of each eye's pupil positions
+    sampled at one calibration site. The site has converged when every
+    mean is known better than threshold (standard error, normalized
+    coordinates) from at least min_samples references.
+    """
+    def __init__(self, threshold=0.002, min_samples=10):
+        self.threshold = threshold
+        self.min_samples = min_samples
+        self.ref = Running_Stats()
+        self.pupils = {}
+
+    def add_ref(self, norm_pos):
+        self.ref.update(norm_pos)
+
+    def add_pupils(self, datums):
+        by_eye = {}
+        for datum in datums:
+            by_eye.setdefault(datum.get('id', 0), []).append(datum['norm_pos'])
+        for eye_id, norm_pos in by_eye.items():
+            self.pupils.setdefault(eye_id, Running_Stats()).update(norm_pos)
+
+    def converged(self):
+        if self.ref.n < self.min_samples or not self.pupils:
+            return False
+        stats = [self.ref] + list(self.pupils.values())
+        return all(s.standard_error < self.threshold for s in stats)
@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+'''
+  Pupil Player Third Party Plugins by cpicanco
+  Copyright (C) 2016 Rafael Picanço.
+
+  The present file is distributed under the terms of the GNU General Public License (GPL v3.0).
+
+  You should have received a copy of the GNU General Public License
+  along with this program. If not, see <http://www.gnu.org/licenses/>.
+'''
+
+# Headless stand-ins for glfw, OpenGL.GL and the Pupil/pyglui drawing
+# helpers. Nothing is drawn, every call is counted in `calls`, so the
+# rendering of a plugin can be measured without a display:
+#
+#     import headless_gl  # with calibration/ on sys.path, the package imports the plugin
+#     headless_gl.install()  # before the plugin module is imported
+#     ...
+#     headless_gl.calls['glfwSwapBuffers']
+#
+# Windows are Headless_Window objects, resize() fires the framebuffer size
+# callback the way a real resize would.
+
+import sys
+import types
+from collections import Counter
+
+calls = Counter()
+
+def reset():
+    calls.clear()
+
+def _counted(name, result=None):
+    def stub(*args, **kwargs):
+        calls[name] += 1
+        return result(*args, **kwargs) if callable(result) else result
+    stub.__name__ = name
+    return stub
+
+class Headless_Window(object):
+    def __init__(self, width, height, title, monitor=None):
+        self.framebuffer_size = (width, height)
+        # framebuffer pixels per window pixel
+        self.hdpi_factor = 1
+        self.title = title
+        self.monitor = monitor
+        self.should_close = False
+        self.callbacks = {}
+
+    @property
+    def window_size(self):
+        return (self.framebuffer_size[0] // self.hdpi_factor, self.framebuffer_size[1] // self.hdpi_factor)
+
+def resize(window, width, height):
+    window.framebuffer_size = (width, height)
+    callback = window.callbacks.get('framebuffer_size')
+    if callback:
+        callback(window, width, height)
+
+def refresh(window):
+    callback = window.callbacks.get('refresh')
+    if callback:
+        callback(window)
+
+_current_context = [None]
+
+def _make_context_current(window):
+    _current_context[0] = window
+
+def _set_callback(kind):
+    def set_callback(window, callback):
+        window.callbacks[kind] = callback
+    return set_callback
+
+GLFW_CONSTANTS = {
+    'GLFW_PRESS': 1,
+    'GLFW_RELEASE': 0,
+    'GLFW_REPEAT': 2,
+    'GLFW_KEY_SPACE': 32,
+    'GLFW_KEY_ESCAPE': 256,
+    'GLFW_CURSOR': 0x00033001,
+    'GLFW_CURSOR_NORMAL': 0x00034001,
+    'GLFW_CURSOR_HIDDEN': 0x00034002,
+}
+
+GLFW_FUNCTIONS = {
+    'glfwInit': lambda: True,
+    'glfwTerminate': None,
+    'glfwPollEvents': None,
+    'glfwGetMonitors': lambda: ['headless monitor 0', 'headless monitor 1'],
+    'glfwGetPrimaryMonitor': lambda: 'headless monitor 0',
+    'glfwGetMonitorName': lambda monitor: monitor,
+    'glfwGetVideoMode': lambda monitor: (1920, 1080, 8, 8, 8, 60),
+    'glfwCreateWindow': lambda width, height, title='', monitor=None, share=None: Headless_Window(width, height, title, monitor),
+    'glfwDestroyWindow': None,
+    'glfwGetCurrentContext': lambda: _current_context[0],
+    'glfwMakeContextCurrent': _make_context_current,
+    'glfwSwapInterval': None,
+    'glfwSwapBuffers': None,
+    'glfwWindowShouldClose': lambda window: window.should_close,
+    'glfwGetFramebufferSize': lambda window: window.framebuffer_size,
+    'glfwGetWindowSize': lambda window: window.window_size,
+    'glfwSetWindowPos': None,
+    'glfwSetInputMode': None,
+    'glfwSetFramebufferSizeCallback': _set_callback('framebuffer_size'),
+    'glfwSetWindowRefreshCallback': _set_callback('refresh'),
+    'glfwSetKeyCallback': _set_callback('key'),
+    'glfwSetMouseButtonCallback': _set_callback('mouse_button'),
+}
+
+GL_CONSTANTS = {
+    'GL_PROJECTION': 0x1701,
+    'GL_MODELVIEW': 0x1700,
+    'GL_POLYGON': 0x0009,
+    'GL_COLOR_BUFFER_BIT': 0x00004000,
+}
+
+GL_FUNCTIONS = ('glMatrixMode', 'glLoadIdentity', 'glOrtho', 'glViewport', 'glClear', 'glClearColor')
+
+GL_UTILS_FUNCTIONS = ('adjust_gl_view', 'clear_gl_screen', 'basic_gl_setup', 'make_coord_system_norm_based', 'make_coord_system_pixel_based')
+
+DRAW_FUNCTIONS = ('draw_points', 'draw_polyline', 'draw_circle')
+
+class _Font_Context(object):
+    """
+    pyglui.pyfontstash.fontstash.Context
+    """
+    def __getattr__(self, name):
+        return _counted('fontstash.' + name)
+
+class _Widget(object):
+    """
+    any pyglui.ui element
+    """
+    def __init__(self, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+        self.elements = []
+
+    def append(self, element):
+        self.elements.append(element)
+
+    def __getattr__(self, name):
+        return _counted('ui.' + name)
+
+def _module(name, attributes):
+    module = types.ModuleType(name)
+    module.__dict__.update(attributes)
+    module.__all__ = [key for key in attributes if not key.startswith('_')]
+    return module
+
+def modules():
+    """
+    returns name : module for everything install() puts in sys.modules
+    """
+    glfw = dict(GLFW_CONSTANTS)
+    glfw.update({name: _counted(name, result) for name, result in GLFW_FUNCTIONS.items()})
+    gl = dict(GL_CONSTANTS)
+    gl.update({name: _counted(name) for name in GL_FUNCTIONS})
+    gl_utils = {name: _counted(name) for name in GL_UTILS_FUNCTIONS}
+    draw = {name: _counted(name) for name in DRAW_FUNCTIONS}
+    draw['RGBA'] = lambda *rgba: rgba
+    ui = {name: _Widget for name in ('Info_Text', 'Switch', 'Slider', 'Selector', 'Button', 'Text_Input', 'Growing_Menu', 'Scrolling_Menu', 'Thumb')}
+    ui['get_opensans_font_path'] = lambda: ''
+    return {
+        'glfw': _module('glfw', glfw),
+        'OpenGL': _module('OpenGL', {}),
+        'OpenGL.GL': _module('OpenGL.GL', gl),
+        'gl_utils': _module('gl_utils', gl_utils),
+        'pyglui': _module('pyglui', {}),
+        'pyglui.ui': _module('pyglui.ui', ui),
+        'pyglui.cygl': _module('pyglui.cygl', {}),
+        'pyglui.cygl.utils': _module('pyglui.cygl.utils', draw),
+        'pyglui.pyfontstash': _module('pyglui.pyfontstash', {'fontstash': types.SimpleNamespace(Context=_Font_Context)}),
+    }
+
+def install():
+    """
+    Replaces the GL modules in sys.modules, has to run before the modules
+    that use them are imported.
+    """
+    for name, module in modules().items():
+        sys.modules[name] = module
+    # attribute access of submodules, e.g. pyglui.ui after import pyglui
+    sys.modules['OpenGL'].GL = sys.modules['OpenGL.GL']
+    sys.modules['pyglui'].ui = sys.modules['pyglui.ui']
+    sys.modules['pyglui'].cygl = sys.modules['pyglui.cygl']
+    sys.modules['pyglui'].pyfontstash = sys.modules['pyglui.pyfontstash']
+    sys.modules['pyglui.cygl'].utils = sys.modules['pyglui.cygl.utils']
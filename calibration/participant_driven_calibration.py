@@ -30,17 +30,80 @@ from pyglui.ui import get_opensans_font_path
 from calibration_routines.calibration_plugin_base import Calibration_Plugin
 from calibration_routines.finish_calibration import finish_calibration
 from calibration_routines.screen_marker_calibration import interp_fn
+from .calibration_samples import Calibration_Samples, Site_Convergence
+from .accuracy_evaluation import Accuracy_Evaluator
+from .calibration_log import Calibration_Log_Writer, calibration_log_path, latest_calibration_log, load_calibration_log
 
 #logging
 import logging
 logger = logging.getLogger(__name__)
 
-# window calbacks
-def on_resize(window,w,h):
-    active_window = glfwGetCurrentContext()
-    glfwMakeContextCurrent(window)
-    adjust_gl_view(w,h)
-    glfwMakeContextCurrent(active_window)
+class Render_Scheduler(object):
+    """
+    Redraw bookkeeping for a window with slowly changing content. The
+    window is drawn only when the visible state differs from the state
+    drawn last or after invalidate(). Framebuffer size and hdpi factor are
+    kept until resized(), the projection is set again after a resize only.
+    """
+    def __init__(self):
+        self.framebuffer_size = None
+        self.hdpi_factor = 1.
+        self.projection_dirty = True
+        self._dirty = True
+        self._drawn_state = None
+        self.redraws = 0
+        self.skipped = 0
+
+    def resized(self, framebuffer_size, window_size):
+        self.framebuffer_size = tuple(framebuffer_size)
+        if window_size[0]:
+            self.hdpi_factor = framebuffer_size[0]/float(window_size[0])
+        self.projection_dirty = True
+        self._dirty = True
+
+    def invalidate(self):
+        self._dirty = True
+
+    def needs_redraw(self, state):
+        if self._dirty or state != self._drawn_state:
+            self._dirty = False
+            self._drawn_state = state
+            self.redraws += 1
+            return True
+        self.skipped += 1
+        return False
+
+def shift_markers(markers, offset, frame_size):
+    """
+    markers : circle markers found in a crop of the frame
+    offset : (x, y) of the crop in the frame
+    frame_size : (width, height) of the frame
+
+    returns copies of the markers in frame coordinates, CircleTracker
+    keeps the markers it returned to track them in the next crop
+    """
+    dx, dy = offset
+    shifted = []
+    for marker in markers:
+        marker = dict(marker)
+        marker['img_pos'] = (marker['img_pos'][0]+dx, marker['img_pos'][1]+dy)
+        marker['norm_pos'] = normalize(marker['img_pos'], frame_size, flip_y=True)
+        marker['ellipses'] = [((e[0][0]+dx, e[0][1]+dy),) + tuple(e[1:]) for e in marker['ellipses']]
+        shifted.append(marker)
+    return shifted
+
+def marker_roi(center, size, frame_shape):
+    """
+    returns the (x0, y0, x1, y1) square of size pixels around center,
+    clipped to the frame, or None when nothing of it is inside
+    """
+    height, width = frame_shape[:2]
+    half = size/2.
+    x0, x1 = int(max(0, center[0]-half)), int(min(width, center[0]+half))
+    y0, y1 = int(max(0, center[1]-half)), int(min(height, center[1]+half))
+    if x1-x0 < 2 or y1-y0 < 2:
+        return None
+    return x0, y0, x1, y1
 
 class Participant_Driven_Screen_Marker_Calibration(Calibration_Plugin):
     """
@@ -55,7 +118,14 @@ class Participant_Driven_Screen_Marker_Calibration(Calibration_Plugin):
             fullscreen=True,
             marker_scale=1.0,
             sample_duration=40,
-            monitor_idx=1
+            monitor_idx=1,
+            pupil_window=1.,
+            pupil_outside_stride=0,
+            roi_detection=True,
+            log_sessions=True,
+            adaptive_sampling=False,
+            convergence_threshold=0.002,
+            streaming_accuracy=False
         ):
         super().__init__(g_pool)
         self.detected = False
@@ -65,7 +135,24 @@ class Participant_Driven_Screen_Marker_Calibration(Calibration_Plugin):
         self.fixation_boost = sample_duration/2.
         self.lead_in = 25 #frames of marker shown before starting to sample
         self.lead_out = 5 #frames of markers shown after sampling is donw
+        # end sampling at a site as soon as the sample means are stable, sample_duration at most
+        self.adaptive_sampling = adaptive_sampling
+        self.convergence_threshold = convergence_threshold # standard error, normalized coordinates
+        self.min_site_samples = 10 # reference samples before a site may converge
+        self.site_convergence = Site_Convergence(convergence_threshold, self.min_site_samples)
         self.monitor_idx = monitor_idx
+        self.pupil_window = pupil_window # seconds of pupil data kept around reference samples
+        self.pupil_outside_stride = pupil_outside_stride # keep one of every n pupils outside the window, 0 keeps none
+        self.samples = Calibration_Samples(pupil_window, pupil_outside_stride)
+        # stream samples to disk so a crashed or aborted session can be fitted again
+        self.log_sessions = log_sessions
+        self._log = None
+        self.session_completed = False # all sites were sampled
+        # per site accuracy test results computed while sampling and published in place of
+        # finish_accuracy_test, which sends all samples to the Accuracy_Visualizer at the end
+        self.streaming_accuracy = streaming_accuracy
+        self.accuracy = None
+        self.accuracy_results = None
 
         self.active_site = None
         self.sites = []
@@ -75,6 +162,7 @@ class Participant_Driven_Screen_Marker_Calibration(Calibration_Plugin):
         self.marker_scale = marker_scale
 
         self._window = None
+        self._render = Render_Scheduler()
         self.menu = None
         self.button = None
         self.fullscreen = fullscreen
@@ -97,6 +185,15 @@ class Participant_Driven_Screen_Marker_Calibration(Calibration_Plugin):
         self.circle_tracker = CircleTracker()
         self.markers = []
 
+        # look for the marker only where the active site is expected in the world image
+        self.roi_detection = roi_detection
+        self.roi_min_size = 64 # px
+        self.roi_marker_sizes = 3. # roi side in outer marker ellipse diameters
+        self.roi_frame_fraction = .25 # roi side relative to the frame width before the marker size is known
+        self._roi_circle_tracker = None
+        self._site_img_pos = {}
+        self._marker_size = None
+
     def init_ui(self):
         super().init_ui()
         self.menu.label = "Participant Driven Screen Marker Calibration"
@@ -106,6 +203,14 @@ class Participant_Driven_Screen_Marker_Calibration(Calibration_Plugin):
         self.menu.append(ui.Switch('fullscreen',self,label='Use fullscreen'))
         self.menu.append(ui.Slider('marker_scale',self,step=0.1,min=0.5,max=2.0,label='Marker size'))
         self.menu.append(ui.Slider('sample_duration',self,step=1,min=10,max=100,label='Sample duration'))
+        self.menu.append(ui.Slider('pupil_window',self,step=0.1,min=0.1,max=5.,label='Pupil window around samples [s]'))
+        self.menu.append(ui.Slider('pupil_outside_stride',self,step=1,min=0,max=30,label='Keep 1 of n pupils outside the window (0: none)'))
+        self.menu.append(ui.Switch('adaptive_sampling',self,label='Finish sites when samples converge'))
+        self.menu.append(ui.Slider('convergence_threshold',self,step=0.0005,min=0.0005,max=0.01,label='Convergence threshold'))
+        self.menu.append(ui.Switch('roi_detection',self,label='Search marker near its expected position'))
+        self.menu.append(ui.Switch('log_sessions',self,label='Log samples to disk'))
+        self.menu.append(ui.Switch('streaming_accuracy',self,label='Evaluate accuracy tests while sampling'))
+        self.menu.append(ui.Button('Re-run last logged session',self.rerun_logged_session))
 
     def start(self):
         if not self.g_pool.capture.online:
@@ -126,8 +231,19 @@ class Participant_Driven_Screen_Marker_Calibration(Calibration_Plugin):
 
         self.active_site = self.sites.pop(0)
         self.active = True
-        self.ref_list = []
-        self.pupil_list = []
+        self.session_completed = False
+        self._log = self.open_log() if self.log_sessions else None
+        self.samples = Calibration_Samples(self.pupil_window, self.pupil_outside_stride, log=self._log)
+        self._site_img_pos = {}
+        self._marker_size = None
+        self.site_convergence = Site_Convergence(self.convergence_threshold, self.min_site_samples)
+        self.accuracy = None
+        if self.mode == 'accuracy_test' and self.streaming_accuracy:
+            intrinsics = self.g_pool.capture.intrinsics
+            if hasattr(intrinsics, 'unprojectPoints'):
+                self.accuracy = Accuracy_Evaluator(intrinsics)
+            else:
+                logger.warning("No camera intrinsics to evaluate the accuracy test while sampling, it is evaluated from all samples at the end.")
         self.clicks_to_close = 5
         self.open_window(self.mode_pretty)
 
@@ -147,20 +263,34 @@ class Participant_Driven_Screen_Marker_Calibration(Calibration_Plugin):
             glfwSetInputMode(self._window, GLFW_CURSOR, GLFW_CURSOR_HIDDEN)
 
             # Register callbacks
-            glfwSetFramebufferSizeCallback(self._window, on_resize)
+            self._render = Render_Scheduler()
+            glfwSetFramebufferSizeCallback(self._window, self.on_resize)
+            glfwSetWindowRefreshCallback(self._window, self.on_window_refresh)
             glfwSetKeyCallback(self._window, self.on_window_key)
             glfwSetMouseButtonCallback(self._window, self.on_window_mouse_button)
-            on_resize(self._window, *glfwGetFramebufferSize(self._window))
+            self.on_resize(self._window, *glfwGetFramebufferSize(self._window))
 
             # gl_state settings
             active_window = glfwGetCurrentContext()
             glfwMakeContextCurrent(self._window)
             basic_gl_setup()
-            # refresh speed settings
+            # refresh speed settings, buffers are only swapped when something changed
             glfwSwapInterval(0)
 
             glfwMakeContextCurrent(active_window)
 
+    # window calbacks
+    def on_resize(self,window,w,h):
+        active_window = glfwGetCurrentContext()
+        glfwMakeContextCurrent(window)
+        adjust_gl_view(w,h)
+        glfwMakeContextCurrent(active_window)
+        self._render.resized((w,h), glfwGetWindowSize(window))
+
+    def on_window_refresh(self,window):
+        # uncovered or exposed, the old content is gone
+        self._render.invalidate()
+
     def on_window_key(self,window, key, scancode, action, mods):
         if action == GLFW_PRESS:
             if key == GLFW_KEY_ESCAPE:
@@ -181,12 +311,78 @@ class Participant_Driven_Screen_Marker_Calibration(Calibration_Plugin):
         self.close_window()
         self.active = False
         self.button.status_text = ''
+        logger.debug("{} pupil samples kept, {} outside the reference window dropped".format(
+            len(self.samples.pupils), self.samples.dropped))
+        if self._log:
+            # not completed when aborted with ESC, clicks or by closing the plugin
+            self._log.close(completed=self.session_completed)
+            logger.info("Calibration samples logged to {}".format(self._log.path))
+            self._log = None
         if self.mode == 'calibration':
-            finish_calibration(self.g_pool, self.pupil_list, self.ref_list)
+            finish_calibration(self.g_pool, self.samples.pupil_list(), self.samples.ref_list())
         elif self.mode == 'accuracy_test':
-            self.finish_accuracy_test(self.pupil_list, self.ref_list)
+            if self.accuracy:
+                self.finish_streamed_accuracy_test()
+            else:
+                self.finish_accuracy_test(self.samples.pupil_list(), self.samples.ref_list())
         super().stop()
 
+    def finish_streamed_accuracy_test(self):
+        results, flagged = self.accuracy.finish()
+        self.accuracy_results = results
+        for site in flagged:
+            self.warn_site_outliers(site)
+        for site in results['sites']:
+            logger.info("Site {}: accuracy {:.2f}, precision {:.2f} degrees from {} samples{}".format(
+                site['site'], site['accuracy'], site['precision'], site['samples'],
+                ', flagged' if site['flagged'] else ''))
+        logger.info("Angular accuracy: {:.2f}, precision: {:.2f} degrees, {} outliers, {} gaze samples without reference".format(
+            results['accuracy'], results['precision'], results['outliers'], results['unmatched']))
+        self.notify_all({
+            'subject': 'accuracy_test.streamed',
+            'timestamp': self.g_pool.get_timestamp(),
+            'results': results,
+            'record': True,
+        })
+
+    def warn_site_outliers(self, site):
+        logger.warning("Site {}: {:.0%} of the gaze is more than {} degrees off the marker".format(
+            site.site, site.outlier_fraction, self.accuracy.outlier_threshold))
+
+    @property
+    def log_dir(self):
+        return os.path.join(self.g_pool.user_dir, 'participant_calibration_logs')
+
+    def open_log(self):
+        try:
+            os.makedirs(self.log_dir, exist_ok=True)
+            return Calibration_Log_Writer(calibration_log_path(self.log_dir, self.mode), self.mode)
+        except OSError as err:
+            logger.warning("Calibration samples will not be logged: {}".format(err))
+            return None
+
+    def rerun_logged_session(self, path=None):
+        """
+        Fits the calibration, or runs the accuracy test, again from the
+        samples of a logged session. The latest log is used by default.
+        """
+        if self.active:
+            logger.error("Can not re-run a logged session during {}".format(self.mode_pretty))
+            return
+        path = path or latest_calibration_log(self.log_dir)
+        if not path:
+            logger.error("No logged calibration session found in {}".format(self.log_dir))
+            return
+        session = load_calibration_log(path)
+        if not session['completed']:
+            logger.warning("{} was not finished, using the samples logged so far".format(path))
+        logger.info("Re-running {} with {} reference and {} pupil samples from {}".format(
+            session['mode'], len(session['ref_list']), len(session['pupil_list']), path))
+        if session['mode'] == 'calibration':
+            finish_calibration(self.g_pool, session['pupil_list'], session['ref_list'])
+        elif session['mode'] == 'accuracy_test':
+            self.finish_accuracy_test(session['pupil_list'], session['ref_list'])
+
     def close_window(self):
         if self._window:
             # enable mouse display
@@ -207,9 +403,7 @@ class Participant_Driven_Screen_Marker_Calibration(Calibration_Plugin):
                 return
 
             # Update the marker
-            self.markers = self.circle_tracker.update(gray_img)
-            # Screen marker takes only Ref marker
-            self.markers = [marker for marker in self.markers if marker['marker_type'] == 'Ref']
+            self.markers = self.detect_markers(gray_img)
 
             if len(self.markers) > 0:
                 self.detected = True
@@ -225,24 +419,46 @@ class Participant_Driven_Screen_Marker_Calibration(Calibration_Plugin):
 
             # only save a valid ref position if within sample window of calibraiton routine
             on_position = self.lead_in < self.screen_marker_state < (self.lead_in+self.sample_duration)
+            sampling = on_position and self.detected and self.space_key_was_pressed
             
-            if on_position and self.detected and self.space_key_was_pressed:
+            if sampling:
                 ref = {}
                 ref["norm_pos"] = self.pos
                 ref["screen_pos"] = marker_pos
                 ref["timestamp"] = frame.timestamp
-                self.ref_list.append(ref)
-
-            # always save pupil positions
-            for p_pt in recent_pupil_positions:
-                if p_pt['confidence'] > self.pupil_confidence_threshold:
-                    self.pupil_list.append(p_pt)
+                self.samples.add_ref(ref)
+                if self.accuracy:
+                    self.accuracy.add_ref(ref, self.active_site)
+
+            # pupil positions are kept only around reference samples
+            confident_pupils = [p_pt for p_pt in recent_pupil_positions
+                                if p_pt['confidence'] > self.pupil_confidence_threshold]
+            for p_pt in confident_pupils:
+                self.samples.add_pupil(p_pt)
+            if self._log:
+                self._log.flush()
+            if self.accuracy:
+                self.accuracy.add_gaze([g for g in events.get('gaze', [])
+                                        if g['confidence'] > self.pupil_confidence_threshold])
+                for site in self.accuracy.update(frame.timestamp):
+                    self.warn_site_outliers(site)
 
             if on_position and self.detected and events.get('fixations', []) and self.space_key_was_pressed:
                 self.screen_marker_state = min(
                     self.sample_duration+self.lead_in,
                     self.screen_marker_state+self.fixation_boost)
 
+            if sampling and self.adaptive_sampling:
+                self.site_convergence.threshold = self.convergence_threshold
+                self.site_convergence.add_ref(self.pos)
+                self.site_convergence.add_pupils(confident_pupils)
+                if self.site_convergence.converged():
+                    logger.debug("Site {} converged after {} samples".format(
+                        self.active_site, self.site_convergence.ref.n))
+                    # skip to the lead out
+                    self.screen_marker_state = max(
+                        self.screen_marker_state, self.sample_duration+self.lead_in)
+
             # Animate the screen marker
             if self.screen_marker_state < self.sample_duration+self.lead_in+self.lead_out:
                 if (self.detected and self.space_key_was_pressed) or not on_position:
@@ -251,9 +467,11 @@ class Participant_Driven_Screen_Marker_Calibration(Calibration_Plugin):
                 self.space_key_was_pressed = False
                 self.screen_marker_state = 0
                 if not self.sites:
+                    self.session_completed = True
                     self.stop()
                     return
                 self.active_site = self.sites.pop(0)
+                self.site_convergence = Site_Convergence(self.convergence_threshold, self.min_site_samples)
                 logger.debug("Moving screen marker to site at {} {}".format(*self.active_site))
 
             # use np.arrays for per element wise math
@@ -264,6 +482,63 @@ class Participant_Driven_Screen_Marker_Calibration(Calibration_Plugin):
         if self._window:
             self.gl_display_in_window()
 
+    def detect_markers(self, gray_img):
+        """
+        Looks for the Ref marker around the predicted position of the active
+        site first and in the whole frame when it is not found there.
+        """
+        roi = self.predicted_marker_roi(gray_img.shape) if self.roi_detection else None
+        markers = []
+        if roi is not None:
+            x0, y0, x1, y1 = roi
+            if self._roi_circle_tracker is None:
+                self._roi_circle_tracker = CircleTracker()
+            markers = self._roi_circle_tracker.update(gray_img[y0:y1, x0:x1])
+            # Screen marker takes only Ref marker
+            markers = [marker for marker in markers if marker['marker_type'] == 'Ref']
+            markers = shift_markers(markers, (x0, y0), gray_img.shape[::-1])
+            if not markers:
+                # the full frame tracker has not run since the last miss, its
+                # previous markers and wait counts would limit it to an old region
+                self.circle_tracker = CircleTracker()
+
+        if not markers:
+            markers = self.circle_tracker.update(gray_img)
+            markers = [marker for marker in markers if marker['marker_type'] == 'Ref']
+
+        if markers and self.active_site is not None:
+            self._site_img_pos[tuple(self.active_site)] = markers[0]['img_pos']
+            # diameter of the outermost ellipse
+            self._marker_size = max(markers[0]['ellipses'][-1][1])
+        return markers
+
+    def predicted_marker_roi(self, frame_shape):
+        """
+        The marker is expected where it was last seen at the active site.
+        For a new site its position is projected from the sites seen so far,
+        the screen is a plane so four sites define the mapping.
+
+        returns (x0, y0, x1, y1) or None when there is no prediction
+        """
+        if self.active_site is None:
+            return None
+        center = self._site_img_pos.get(tuple(self.active_site))
+        if center is None and len(self._site_img_pos) >= 4:
+            sites = np.float32(list(self._site_img_pos.keys()))
+            img_pos = np.float32(list(self._site_img_pos.values()))
+            H, _ = cv2.findHomography(sites, img_pos)
+            if H is not None:
+                site = np.float32([[self.active_site]])
+                center = cv2.perspectiveTransform(site, H)[0, 0]
+        if center is None:
+            return None
+
+        if self._marker_size:
+            size = self.roi_marker_sizes * self._marker_size
+        else:
+            size = self.roi_frame_fraction * frame_shape[1]
+        return marker_roi(center, max(self.roi_min_size, size), frame_shape)
+
     def gl_display(self):
         """
         use gl calls to render
@@ -284,52 +559,63 @@ class Participant_Driven_Screen_Marker_Calibration(Calibration_Plugin):
                 if len(self.markers) > 1:
                    draw_polyline(pts, 1, RGBA(1., 0., 0., .5), line_type=gl.GL_POLYGON)
 
+    def window_state(self):
+        """
+        everything gl_display_in_window shows, alpha in 8 bit steps
+        """
+        alpha = interp_fn(self.screen_marker_state,0.,1.,float(self.sample_duration+self.lead_in+self.lead_out),float(self.lead_in),float(self.sample_duration+self.lead_in))
+        # some feedback on the detection state and button pressing
+        if self.detected and self.on_position and self.space_key_was_pressed:
+            feedback = (.8,.8,0.)
+        else:
+            if self.detected:
+                feedback = (0.,.8,0.)
+            else:
+                feedback = (.8,0.,0.)
+        clicks_to_close = self.clicks_to_close if self.clicks_to_close < 5 else None
+        return (tuple(self.display_pos), self.marker_scale, round(alpha*255)/255., feedback, clicks_to_close)
+
     def gl_display_in_window(self):
-        active_window = glfwGetCurrentContext()
         if glfwWindowShouldClose(self._window):
             self.close_window()
             return
 
+        display_pos, marker_scale, alpha, feedback, clicks_to_close = state = self.window_state()
+        if not self._render.needs_redraw(state):
+            return
+
+        active_window = glfwGetCurrentContext()
         glfwMakeContextCurrent(self._window)
 
         clear_gl_screen()
 
-        hdpi_factor = glfwGetFramebufferSize(self._window)[0]/glfwGetWindowSize(self._window)[0]
-        r = self.marker_scale * hdpi_factor
-        gl.glMatrixMode(gl.GL_PROJECTION)
-        gl.glLoadIdentity()
-        p_window_size = glfwGetFramebufferSize(self._window)
-        gl.glOrtho(0, p_window_size[0], p_window_size[1], 0, -1, 1)
-        # Switch back to Model View Matrix
-        gl.glMatrixMode(gl.GL_MODELVIEW)
-        gl.glLoadIdentity()
+        r = marker_scale * self._render.hdpi_factor
+        p_window_size = self._render.framebuffer_size
+        if self._render.projection_dirty:
+            gl.glMatrixMode(gl.GL_PROJECTION)
+            gl.glLoadIdentity()
+            gl.glOrtho(0, p_window_size[0], p_window_size[1], 0, -1, 1)
+            # Switch back to Model View Matrix
+            gl.glMatrixMode(gl.GL_MODELVIEW)
+            gl.glLoadIdentity()
+            self._render.projection_dirty = False
 
         def map_value(value,in_range=(0,1),out_range=(0,1)):
             ratio = (out_range[1]-out_range[0])/(in_range[1]-in_range[0])
             return (value-in_range[0])*ratio+out_range[0]
 
         pad = 90 * r
-        screen_pos = map_value(self.display_pos[0],out_range=(pad,p_window_size[0]-pad)),map_value(self.display_pos[1],out_range=(p_window_size[1]-pad,pad))
-        alpha = interp_fn(self.screen_marker_state,0.,1.,float(self.sample_duration+self.lead_in+self.lead_out),float(self.lead_in),float(self.sample_duration+self.lead_in))
+        screen_pos = map_value(display_pos[0],out_range=(pad,p_window_size[0]-pad)),map_value(display_pos[1],out_range=(p_window_size[1]-pad,pad))
 
         r2 = 2 * r
         draw_points([screen_pos], size=60*r2, color=RGBA(0., 0., 0., alpha), sharpness=0.9)
         draw_points([screen_pos], size=38*r2, color=RGBA(1., 1., 1., alpha), sharpness=0.8)
         draw_points([screen_pos], size=19*r2, color=RGBA(0., 0., 0., alpha), sharpness=0.55)
+        draw_points([screen_pos],size=3*r2,color=RGBA(*(feedback+(alpha,))),sharpness=0.5)
 
-        # some feedback on the detection state and button pressing
-        if self.detected and self.on_position and self.space_key_was_pressed:
-            color = RGBA(.8,.8,0., alpha)
-        else:
-            if self.detected:
-                color = RGBA(0.,.8,0., alpha)
-            else:
-                color = RGBA(.8,0.,0., alpha)
-        draw_points([screen_pos],size=3*r2,color=color,sharpness=0.5)
-
-        if self.clicks_to_close <5:
+        if clicks_to_close is not None:
             self.glfont.set_size(int(p_window_size[0]/30.))
-            self.glfont.draw_text(p_window_size[0]/2.,p_window_size[1]/4.,'Touch {} more times to cancel {}.'.format(self.clicks_to_close, self.mode_pretty))
+            self.glfont.draw_text(p_window_size[0]/2.,p_window_size[1]/4.,'Touch {} more times to cancel {}.'.format(clicks_to_close, self.mode_pretty))
 
         glfwSwapBuffers(self._window)
         glfwMakeContextCurrent(active_window)
@@ -340,6 +626,13 @@ class Participant_Driven_Screen_Marker_Calibration(Calibration_Plugin):
         d['marker_scale'] = self.marker_scale
         d['sample_duration'] = self.sample_duration
         d['monitor_idx'] = self.monitor_idx
+        d['pupil_window'] = self.pupil_window
+        d['pupil_outside_stride'] = self.pupil_outside_stride
+        d['roi_detection'] = self.roi_detection
+        d['log_sessions'] = self.log_sessions
+        d['adaptive_sampling'] = self.adaptive_sampling
+        d['convergence_threshold'] = self.convergence_threshold
+        d['streaming_accuracy'] = self.streaming_accuracy
         return d
 
     def deinit_ui(self):
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+'''
+  Pupil Player Third Party Plugins by cpicanco
+  Copyright (C) 2016 Rafael Picanço.
+
+  The present file is distributed under the terms of the GNU General Public License (GPL v3.0).
+
+  You should have received a copy of the GNU General Public License
+  along with this program. If not, see <http://www.gnu.org/licenses/>.
+'''
+
+# Pupil imports every module of the plugins folder at startup. A plugin
+# package registers a lazy_plugin proxy instead of its plugin class, the
+# module with the plugin and its cv2, OpenGL, glfw and pyglui imports is
+# loaded the first time the plugin is activated.
+
+import importlib
+
+#logging
+import logging
+logger = logging.getLogger(__name__)
+
+def _import_attribute(path):
+    module_name, _, attribute = path.rpartition('.')
+    return getattr(importlib.import_module(module_name), attribute)
+
+def lazy_plugin(module, class_name, base='plugin.Plugin', package=None, **attributes):
+    """
+    module : module that defines the plugin, relative to package when it
+        starts with a dot
+    class_name : name of the plugin class, the proxy has the same name so
+        stored sessions restore it
+    base : 'module.Class' the plugin derives from, decides where Capture
+        lists the plugin. Capture has imported its own base classes already.
+    attributes : class attributes Capture reads before activation, e.g.
+        uniqueness, order or icon_chr
+
+    returns a proxy class, instantiating it the first time imports module
+    and makes the proxy a subclass of the plugin class
+    """
+    base_class = _import_attribute(base)
+
+    def load_plugin_class(cls):
+        if cls._plugin_class is None:
+            plugin_module = importlib.import_module(module, package)
+            plugin_class = getattr(plugin_module, class_name)
+            # Capture compares type(plugin), plugin.__class__ and this_class
+            # with the registered proxy, so the proxy becomes a subclass of
+            # the plugin class and is instantiated itself from now on. The
+            # registered base stays last, Plugin.base_class is __bases__[-1]
+            # and Plugin_List replaces plugins with the same base_class.
+            cls.__bases__ = (plugin_class, base_class)
+            cls.__doc__ = plugin_class.__doc__
+            cls._plugin_class = plugin_class
+            logger.debug("Loaded {} from {}".format(class_name, plugin_module.__name__))
+        return cls
+
+    def __new__(cls, *args, **kwargs):
+        # the arguments go to __init__ of the plugin class
+        return cls.load_plugin_class()._plugin_class.__new__(cls)
+
+    namespace = {
+        '__new__': __new__,
+        '__module__': package or module,
+        '__doc__': "Proxy of {}.{}, loaded on first activation.".format(module, class_name),
+        '_plugin_class': None,
+        'load_plugin_class': classmethod(load_plugin_class),
+    }
+    namespace.update(attributes)
+    return type(class_name, (base_class,), namespace)
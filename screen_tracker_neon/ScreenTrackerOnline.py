@@ -1,6 +1,11 @@
 import logging
 logger = logging.getLogger(__name__)
 
+import os
+import weakref
+from collections import Counter, deque
+from time import perf_counter
+
 import cv2
 import numpy as np
 
@@ -13,75 +18,292 @@ import gl_utils
 import pyglui
 import pyglui.cygl.utils as pyglui_utils
 
-def sortCorners(corners, center):
+from screen_detection import (
+    Detection_Budget_Governor,
+    Screen_Corner_Filter,
+    Screen_Detection_Worker,
+    Screen_Identities,
+    find_screens,
+    load_screen_corner_cache,
+    max_pyramid_level,
+    screen_corner_cache_path,
+    screen_search_roi,
+    search_screen_corners,
+    track_screen_corners,
+)
+from surface_gaze import (
+    Surface_Gaze_History,
+    gaze_batch,
+    map_points_to_surface,
+    surface_gaze_datums,
+    undistorted_image_points,
+    update_surface_heatmap,
+)
+
+def detect_screen_corners(gray_img, draw_contours=False, roi=None, pyramid_level=0, timings=None):
+    """
+    Same as find_screens, the screens are returned as Screen_Markers with
+    ids in detection order.
+    """
+    screens = find_screens(gray_img, roi=roi, pyramid_level=pyramid_level, timings=timings)
+    return Screen_Markers(screens, range(32, 32 + len(screens)))
+
+def screen_corner_detection(corners, marker_id=32):
+    """
+    corners : sorted screen corners (tl, tr, br, bl) in image pixels
+
+    returns the square tag detection dict expected by Surface_Marker
+    """
+    r = np.float32(corners).reshape(4, 1, 2)
+    centroid = r.sum(axis=0, dtype='float64')[0]*0.25
+    return {'id':marker_id,
+            'verts':r.tolist(),
+            'perimeter':cv2.arcLength(r,closed=True),
+            'centroid':centroid.tolist(),
+            "frames_since_true_detection":0,
+            "id_confidence":1.}
+
+SCREEN_MARKER_DTYPE = np.dtype([
+    ("id", "i4"),
+    ("verts", "f4", (4, 1, 2)),
+    ("perimeter", "f4"),
+    ("centroid", "f8", (2,)),
+])
+
+# marker id : Surface_Marker, only read for uid and marker type
+_surface_marker_prototypes = {}
+
+def _surface_marker_prototype(marker_id):
+    prototype = _surface_marker_prototypes.get(marker_id)
+    if prototype is None:
+        prototype = Surface_Marker.from_square_tag_detection(
+            screen_corner_detection(np.zeros((4, 2)), marker_id)
+        )
+        _surface_marker_prototypes[marker_id] = prototype
+    return prototype
+
+class Screen_Marker(object):
+    """
+    One screen of Screen_Markers, has the attributes surfaces read from a
+    Surface_Marker.
+    """
+
+    __slots__ = ("_row", "uid", "marker_type")
+
+    def __init__(self, row):
+        self._row = row
+        prototype = _surface_marker_prototype(int(row["id"]))
+        self.uid = prototype.uid
+        self.marker_type = getattr(prototype, "marker_type", None)
+
+    def __getstate__(self):
+        return self._row
+
+    def __setstate__(self, row):
+        self.__init__(row)
+
+    @property
+    def tag_id(self):
+        return int(self._row["id"])
+
+    @property
+    def id_confidence(self):
+        return 1.
+
+    @property
+    def verts_px(self):
+        return self._row["verts"]
+
+    @property
+    def perimeter(self):
+        return float(self._row["perimeter"])
+
+    @property
+    def centroid(self):
+        return self._row["centroid"]
+
+    def __repr__(self):
+        return "Screen_Marker(uid={!r})".format(self.uid)
+
+class Screen_Markers(object):
     """
-    corners : list of points
-    center : point
+    The screens of one frame in a SCREEN_MARKER_DTYPE array. Can be iterated
+    any number of times, the Screen_Marker views are made once on first use.
+    Pickles as the plain array.
+
+    screens : (n, 4, 2) sorted corners in image pixels
+    ids : n marker ids
     """
-    top = [corner for corner in corners if corner[1] < center[1]]
-    bot = [corner for corner in corners if corner[1] >= center[1]]
 
-    corners = np.zeros(shape=(4,2))
+    __slots__ = ("data", "_markers")
+
+    def __init__(self, screens=(), ids=()):
+        screens = np.asarray(screens, dtype=np.float32).reshape(-1, 4, 2)
+        self.data = np.empty(len(screens), dtype=SCREEN_MARKER_DTYPE)
+        self.data["id"] = np.fromiter(ids, dtype=np.int32, count=len(screens))
+        self.data["verts"] = screens.reshape(-1, 4, 1, 2)
+        # closed polygon, each corner to the next one
+        edges = np.roll(screens, -1, axis=1) - screens
+        self.data["perimeter"] = np.linalg.norm(edges, axis=2).sum(axis=1)
+        self.data["centroid"] = screens.mean(axis=1, dtype=np.float64)
+        self._markers = None
 
-    if (len(top) == 2) and (len(bot) == 2):
-        tl, tr = sorted(top, key=lambda p: p[0])
-        bl, br = sorted(bot, key=lambda p: p[0])
+    @classmethod
+    def from_array(cls, data):
+        markers = cls.__new__(cls)
+        markers.data = data
+        markers._markers = None
+        return markers
 
-    corners[0] = np.array(tl)
-    corners[1] = np.array(tr)
-    corners[2] = np.array(br)
-    corners[3] = np.array(bl)
+    def __getstate__(self):
+        return self.data
 
-    return corners
+    def __setstate__(self, data):
+        self.data = data
+        self._markers = None
+
+    @property
+    def ids(self):
+        return self.data["id"].tolist()
+
+    @property
+    def uids(self):
+        return [marker.uid for marker in self.markers]
+
+    @property
+    def corners(self):
+        """
+        (n, 4, 2) float32 view of the corners
+        """
+        return self.data["verts"].reshape(-1, 4, 2)
 
-criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 100, 0.001)
+    @property
+    def markers(self):
+        if self._markers is None:
+            self._markers = tuple(Screen_Marker(row) for row in self.data)
+        return self._markers
 
-def detect_screen_corners(gray_img, draw_contours=False):
-    edges = cv2.adaptiveThreshold(gray_img, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY_INV, 25, -5)
+    def __len__(self):
+        return len(self.data)
 
-    *_, contours, hierarchy = cv2.findContours(edges,
-                                    mode=cv2.RETR_TREE,
-                                    method=cv2.CHAIN_APPROX_SIMPLE,offset=(0,0)) #TC89_KCOS
+    def __iter__(self):
+        return iter(self.markers)
 
-    # if draw_contours:
-    #     cv2.drawContours(gray_img, contours,-1, (0,0,0))
+    def __getitem__(self, index):
+        return self.markers[index]
 
-    # remove extra encapsulation
-    hierarchy = hierarchy[0]
-    contours = np.array(contours, dtype=object)
+    def __repr__(self):
+        return "Screen_Markers({})".format(list(self.markers))
 
-    # keep only contours                        with parents     and      children
-    # contours = contours[np.logical_and(hierarchy[:,3]>=0, hierarchy[:,2]>=0)]
-    # contours = np.array(contours)
+class _Stage_Timer(object):
+    __slots__ = ('profiler', 'stage', 'start')
 
-    contours = np.array([c for c, h in zip(contours, hierarchy) if h[3] >= 0 and h[2] >= 0 and cv2.contourArea(c) > (20 * 2500)], dtype=object)
+    def __init__(self, profiler, stage):
+        self.profiler = profiler
+        self.stage = stage
+        self.start = 0.
 
-    screen_corners = []
-    if len(contours) > 0:
-        contours = contours[0].astype(np.int32)
-        epsilon = cv2.arcLength(contours, True)*0.1
-        aprox_contours = [cv2.approxPolyDP(contours, epsilon, True)]
-        rect_cand = [r for r in aprox_contours if r.shape[0]==4]
+    def __enter__(self):
+        self.start = perf_counter()
+        return self
 
-        for count, r in enumerate(rect_cand):
-            r = np.float32(r)
-            cv2.cornerSubPix(gray_img, r, (3,3), (-1,-1), criteria)
-            corners = np.array([r[0][0], r[1][0], r[2][0], r[3][0]])
-            centroid = corners.sum(axis=0, dtype='float64')*0.25
-            centroid.shape = (2)
+    def __exit__(self, *exc):
+        self.profiler.add(self.stage, perf_counter() - self.start)
 
-            corners = sortCorners(corners, centroid)
-            r[0][0], r[1][0], r[2][0], r[3][0] = corners[0], corners[1], corners[2], corners[3]
+class Hot_Path_Profiler(object):
+    """
+    Rolling timings of the world loop stages of the screen tracker.
+    Nothing is recorded while disabled.
+    """
+    def __init__(self, window=900):
+        self.enabled = False
+        self.window = window
+        self.reset()
+
+    def reset(self):
+        self.samples = {}
+        self.counters = Counter()
+        self._timers = {}
+        self._frame_intervals = deque(maxlen=30)
+        self._last_frame = None
+
+    def measure(self, stage):
+        try:
+            return self._timers[stage]
+        except KeyError:
+            timer = self._timers[stage] = _Stage_Timer(self, stage)
+            return timer
+
+    def add(self, stage, seconds):
+        if not self.enabled:
+            return
+        try:
+            self.samples[stage].append(seconds)
+        except KeyError:
+            self.samples[stage] = deque([seconds], maxlen=self.window)
 
-            corner = {'id':32+count,
-                        'verts':r.tolist(),
-                        'perimeter':cv2.arcLength(r,closed=True),
-                        'centroid':centroid.tolist(),
-                        "frames_since_true_detection":0,
-                        "id_confidence":1.}
-            screen_corners.append(corner)
+    def count(self, name, n=1):
+        if self.enabled:
+            self.counters[name] += n
 
-    return map(Surface_Marker.from_square_tag_detection, screen_corners)
+    @property
+    def frame_interval(self):
+        if not self._frame_intervals:
+            return None
+        return float(np.median(self._frame_intervals))
+
+    def end_frame(self, frame_index, timestamp, seconds):
+        """
+        Records the time spent on the whole frame and counts frames skipped
+        by the world loop and frames that took longer than the frame interval.
+        """
+        if not self.enabled:
+            return
+        self.add('recent_events', seconds)
+        self.counters['frames'] += 1
+        if self._last_frame is not None:
+            last_index, last_timestamp = self._last_frame
+            if frame_index > last_index + 1:
+                self.counters['skipped_frames'] += frame_index - last_index - 1
+            if frame_index == last_index + 1 and timestamp > last_timestamp:
+                self._frame_intervals.append(timestamp - last_timestamp)
+        self._last_frame = frame_index, timestamp
+
+        interval = self.frame_interval
+        if interval is not None and seconds > interval:
+            self.counters['over_budget_frames'] += 1
+
+    def percentiles(self, stage):
+        """
+        returns p50, p95, p99 in milliseconds
+        """
+        return tuple(np.percentile(self.samples[stage], (50, 95, 99)) * 1000)
+
+    def report(self):
+        """
+        returns one line per stage and one for the counters
+        """
+        lines = []
+        for stage in sorted(self.samples):
+            p50, p95, p99 = self.percentiles(stage)
+            lines.append(
+                "{}: p50 {:.2f} ms, p95 {:.2f} ms, p99 {:.2f} ms".format(stage, p50, p95, p99)
+            )
+        lines.append(", ".join("{} {}".format(k, v) for k, v in sorted(self.counters.items())))
+        return lines
+
+    def save(self, path):
+        with open(path, "w") as f:
+            f.write("stage,count,p50_ms,p95_ms,p99_ms,max_ms\n")
+            for stage in sorted(self.samples):
+                f.write("{},{},{:.3f},{:.3f},{:.3f},{:.3f}\n".format(
+                    stage,
+                    len(self.samples[stage]),
+                    *self.percentiles(stage),
+                    max(self.samples[stage]) * 1000,
+                ))
+            for name, value in sorted(self.counters.items()):
+                f.write("{},{},,,,\n".format(name, value))
 
 class Screen_Tracker_Online(Surface_Tracker):
     """
@@ -92,10 +314,82 @@ class Screen_Tracker_Online(Surface_Tracker):
     def parse_pretty_class_name(cls) -> str:
         return "Screen Tracker"
 
+    # settings restored from the session, see get_init_dict
+    PERSISTENT_SETTINGS = (
+        "roi_tracking",
+        "roi_padding",
+        "full_search_interval",
+        "detection_pyramid_level",
+        "detection_block_size",
+        "flow_tracking",
+        "redetection_interval",
+        "background_detection",
+        "auto_tune_detection",
+        "detection_budget",
+        "location_reuse_epsilon",
+        "use_corner_cache",
+        "publish_gaze_shm",
+        "gaze_shm_name",
+    )
+
     def __init__(self, g_pool, *args, **kwargs):
         self.freeze_scene = False
         self.frozen_scene_frame = None
         self.frozen_scene_tex = None
+        # search only around the last known screen position, full frame when lost
+        self.roi_tracking = True
+        self.roi_padding = 0.25
+        # (n, 4, 2) corners of the screens found in the last frame and their marker ids
+        self._tracked_screens = None
+        self._screen_ids = Screen_Identities()
+        # search the whole frame now and then to find screens outside the region
+        self.full_search_interval = 30
+        self._searches_since_full_search = 0
+        self._tracked_screen_ids = []
+        # find the screen on a downscaled frame, refine corners at full resolution
+        self.detection_pyramid_level = 0
+        self.detection_block_size = 25
+        # carry corners with optical flow between full detections
+        self.flow_tracking = False
+        self.redetection_interval = 5
+        self._flow_prev_gray = None
+        self._frames_since_detection = 0
+        self._corner_filter = Screen_Corner_Filter()
+        # run detection off the world loop, use the newest finished result
+        self.background_detection = False
+        self._detection_worker = None
+        # adapt the settings above to keep detection within a share of the frame time
+        self.auto_tune_detection = False
+        self.detection_budget = 0.3
+        self._governor = Detection_Budget_Governor()
+        # opt-in timings of the hot path
+        self._profiler = Hot_Path_Profiler()
+        self._profiler_info = None
+        self._gaze_histories = weakref.WeakKeyDictionary()
+        # gaze mapped in the current frame, (timestamp, x, y, confidence) rows on each surface
+        self._gaze_on_surfaces = {}
+        # reuse surface locations while the corners move less than this [px]
+        self.location_reuse_epsilon = 0.05
+        self._located_marker_uids = None
+        self._located_marker_verts = None
+        self._located_surfaces = weakref.WeakSet()
+        # frame (index, timestamp) the markers and locations were computed for
+        self._detected_frame_key = None
+        self._located_frame_key = None
+        # corners detected offline for the video file being played back
+        self.use_corner_cache = True
+        self._corner_cache = None
+        self._corner_cache_source = None
+        # surface gaze for local consumers, see surface_gaze_shm
+        self.publish_gaze_shm = False
+        self.gaze_shm_name = "pupil_surface_gaze" # surface_gaze_shm.DEFAULT_NAME
+        self._gaze_publisher = None
+        for name in self.PERSISTENT_SETTINGS:
+            if name in kwargs:
+                setattr(self, name, kwargs.pop(name))
+        if self.auto_tune_detection:
+            # the governor starts at the best settings, not at the restored ones
+            self._apply_detection_settings()
         super().__init__(g_pool, *args, use_online_detection=True, **kwargs)
 
         self.menu = None
@@ -128,15 +422,168 @@ class Screen_Tracker_Online(Surface_Tracker):
         )
 
     def _update_markers(self, frame):
-        self._detect_markers(frame)
+        # a frozen scene feeds the same frame again, its markers are known
+        key = frame.index, frame.timestamp
+        if key == self._detected_frame_key:
+            self._profiler.count("frame_reuse")
+            return
+        self._detected_frame_key = key
+
+        start = perf_counter()
+        with self._profiler.measure("_detect_markers"):
+            self._detect_markers(frame)
+        # in the background only polling and submitting is timed
+        if self.auto_tune_detection and not self.background_detection:
+            self._tune_detection(frame, perf_counter() - start)
+
+    def _tuned_knobs(self):
+        """
+        returns the governor knobs that change the detection cost in the current mode
+        """
+        knobs = ["detection_pyramid_level", "detection_block_size"]
+        if self.roi_tracking:
+            knobs.append("roi_padding")
+        if self.flow_tracking:
+            knobs.append("redetection_interval")
+        return knobs
+
+    def _tune_detection(self, frame, detection_time):
+        if self._governor.set_knobs(self._tuned_knobs(), max_pyramid_level(frame.width)):
+            self._apply_detection_settings()
+        self._governor.budget = self.detection_budget
+        if self._governor.update(frame.timestamp, detection_time):
+            self._apply_detection_settings()
+            logger.debug(
+                "Detection load {:.0%} of the frame time, using {}".format(
+                    self._governor.load, self._governor.settings
+                )
+            )
+
+    def _apply_detection_settings(self):
+        for knob, value in self._governor.settings.items():
+            setattr(self, knob, value)
 
     def _detect_markers(self, frame):
-        self.markers = detect_screen_corners(gray_img=frame.gray)
-        # markers = self._remove_duplicate_markers(markers)
+        cache = self._screen_corner_cache()
+        if cache is not None and 0 <= frame.index < len(cache):
+            row = cache[frame.index]
+            self.markers = Screen_Markers(*self._track_screens(row["corners"][row["confidence"] > 0]))
+            return
+
+        if self.background_detection:
+            self._detect_markers_in_background(frame)
+            return
+
+        if not self.flow_tracking:
+            self._flow_prev_gray = None
+            self.markers = Screen_Markers(*self._track_screens(self._detect_screens(frame.gray)))
+            return
+
+        tracked = None
+        if (
+            self._flow_prev_gray is not None
+            and self._tracked_screens is not None
+            and self._frames_since_detection < self.redetection_interval
+        ):
+            tracked = track_screen_corners(
+                self._flow_prev_gray,
+                frame.gray,
+                self._tracked_screens,
+                predicted=self._corner_filter.predict(),
+            )
+        self._flow_prev_gray = frame.gray
+
+        if tracked is None:
+            # time for a full detection or flow confidence dropped
+            screens = self._detect_screens(frame.gray)
+            self._frames_since_detection = 0
+        else:
+            screens = tracked[0]
+            self._frames_since_detection += 1
+
+        previous_ids = self._tracked_screen_ids
+        screens, ids = self._track_screens(screens)
+        if not ids:
+            self._corner_filter.reset()
+            self.markers = Screen_Markers()
+            return
+        if ids != previous_ids:
+            # other screens or another order, the filter state does not apply
+            self._corner_filter.reset()
+        self.markers = Screen_Markers(self._corner_filter.update(screens), ids)
+
+    def _track_screens(self, screens):
+        """
+        Assigns stable ids to the screens and remembers them for the next frame.
+        """
+        screens = np.asarray(screens, dtype=np.float32).reshape(-1, 4, 2)
+        ids = self._screen_ids.assign(screens)
+        self._tracked_screens = screens if len(screens) else None
+        self._tracked_screen_ids = ids
+        return screens, ids
+
+    def _screen_corner_cache(self):
+        """
+        The cache is only available when the world video is played back from
+        a file and detect_screen_corners_in_video has been run on it.
+        """
+        if not self.use_corner_cache:
+            return None
+        source_path = getattr(self.g_pool.capture, "source_path", None)
+        if source_path != self._corner_cache_source:
+            self._corner_cache_source = source_path
+            self._corner_cache = None
+            if source_path:
+                self._corner_cache = load_screen_corner_cache(screen_corner_cache_path(source_path))
+                if self._corner_cache is not None:
+                    logger.info("Using screen corners cached for {}".format(source_path))
+        return self._corner_cache
+
+    def _detect_markers_in_background(self, frame):
+        if self._detection_worker is None:
+            self._detection_worker = Screen_Detection_Worker()
+
+        # take the newest result first, so the search region follows it
+        result = self._detection_worker.poll()
+        self.markers = Screen_Markers(*self._track_screens(result.screens if result else []))
+
+        self._detection_worker.submit(
+            frame.index,
+            frame.timestamp,
+            frame.gray,
+            **self._screen_search_kwargs(frame.gray.shape)
+        )
+
+    def _stop_detection_worker(self):
+        if self._detection_worker is not None:
+            self._detection_worker.stop()
+            self._detection_worker = None
+
+    def _screen_search_kwargs(self, frame_shape):
+        roi = None
+        expected_screens = 0
+        if self._tracked_screens is not None:
+            expected_screens = len(self._tracked_screens)
+            if self.roi_tracking and self._searches_since_full_search < self.full_search_interval:
+                roi = screen_search_roi(self._tracked_screens, frame_shape, self.roi_padding)
+        if roi is None:
+            self._searches_since_full_search = 0
+        else:
+            self._searches_since_full_search += 1
+        return dict(
+            roi=roi,
+            pyramid_level=self.detection_pyramid_level,
+            expected_screens=expected_screens,
+            block_size=self.detection_block_size,
+        )
+
+    def _detect_screens(self, gray_img):
+        return search_screen_corners(gray_img, **self._screen_search_kwargs(gray_img.shape))
 
     def _update_ui_custom(self):
         def set_freeze_scene(val):
             self.freeze_scene = val
+            self._detected_frame_key = None
             if val:
                 self.frozen_scene_tex = pyglui_utils.Named_Texture()
                 self.frozen_scene_tex.update_from_ndarray(self.current_frame.img)
@@ -148,6 +595,117 @@ class Screen_Tracker_Online(Surface_Tracker):
                 "freeze_scene", self, label="Freeze Scene", setter=set_freeze_scene
             )
         )
+        self.menu.append(
+            pyglui.ui.Switch(
+                "roi_tracking", self, label="Track Screen Region"
+            )
+        )
+        self.menu.append(
+            pyglui.ui.Slider(
+                "roi_padding", self, min=0.05, max=1.0, step=0.05, label="Region Padding"
+            )
+        )
+        self.menu.append(
+            pyglui.ui.Slider(
+                "detection_pyramid_level", self, min=0, max=2, step=1, label="Detection Downscale Level"
+            )
+        )
+        self.menu.append(
+            pyglui.ui.Slider(
+                "detection_block_size", self, min=5, max=51, step=2, label="Threshold Block Size [px]"
+            )
+        )
+        self.menu.append(
+            pyglui.ui.Switch(
+                "flow_tracking", self, label="Track Corners Between Detections"
+            )
+        )
+        self.menu.append(
+            pyglui.ui.Slider(
+                "redetection_interval", self, min=1, max=30, step=1, label="Frames Between Detections"
+            )
+        )
+
+        def set_auto_tune_detection(val):
+            self.auto_tune_detection = val
+            if val:
+                # start from the most accurate settings and walk down
+                self._governor.reset()
+                self._apply_detection_settings()
+
+        self.menu.append(
+            pyglui.ui.Switch(
+                "auto_tune_detection",
+                self,
+                label="Auto Tune Detection",
+                setter=set_auto_tune_detection,
+            )
+        )
+        self.menu.append(
+            pyglui.ui.Slider(
+                "detection_budget", self, min=0.05, max=0.9, step=0.05, label="Detection Budget [frame time]"
+            )
+        )
+
+        def set_background_detection(val):
+            self.background_detection = val
+            if not val:
+                self._stop_detection_worker()
+
+        self.menu.append(
+            pyglui.ui.Switch(
+                "background_detection",
+                self,
+                label="Detect In Background",
+                setter=set_background_detection,
+            )
+        )
+
+        self.menu.append(
+            pyglui.ui.Switch(
+                "use_corner_cache", self, label="Use Offline Detected Corners"
+            )
+        )
+
+        def set_publish_gaze_shm(val):
+            self.publish_gaze_shm = val
+            if not val:
+                self._stop_gaze_publisher()
+
+        self.menu.append(
+            pyglui.ui.Switch(
+                "publish_gaze_shm",
+                self,
+                label="Publish Surface Gaze To Shared Memory",
+                setter=set_publish_gaze_shm,
+            )
+        )
+        self.menu.append(
+            pyglui.ui.Slider(
+                "location_reuse_epsilon",
+                self,
+                min=0.0,
+                max=1.0,
+                step=0.01,
+                label="Reuse Location Below [px]",
+            )
+        )
+
+        def set_profiling(val):
+            if val:
+                self._profiler.reset()
+            elif self._profiler.enabled:
+                self._save_profiler_report()
+            self._profiler.enabled = val
+
+        self.menu.append(
+            pyglui.ui.Switch(
+                "enabled", self._profiler, label="Measure Timings", setter=set_profiling
+            )
+        )
+        self._profiler_info = pyglui.ui.Info_Text("")
+        self.menu.append(self._profiler_info)
+        self._update_profiler_info()
 
     def _per_surface_ui_custom(self, surface, surf_menu):
         def set_gaze_hist_len(val):
@@ -173,15 +731,30 @@ class Screen_Tracker_Online(Surface_Tracker):
             current_frame = events.get("frame")
             events["frame"] = self.current_frame
 
+        frame_start = perf_counter()
         super().recent_events(events)
 
         if not self.current_frame:
             return
 
-        self._update_surface_gaze_history(events, self.current_frame.timestamp)
+        with self._profiler.measure("_update_surface_gaze_history"):
+            self._update_surface_gaze_history(events, self.current_frame.timestamp)
+
+        if self.publish_gaze_shm:
+            with self._profiler.measure("_publish_surface_gaze"):
+                self._publish_surface_gaze()
 
         if self.gui.show_heatmap:
-            self._update_surface_heatmaps()
+            with self._profiler.measure("_update_surface_heatmaps"):
+                self._update_surface_heatmaps()
+
+        self._profiler.end_frame(
+            self.current_frame.index,
+            self.current_frame.timestamp,
+            perf_counter() - frame_start,
+        )
+        if self._profiler.enabled and self._profiler.counters["frames"] % 30 == 0:
+            self._update_profiler_info()
 
         if self.freeze_scene:
             # After we are done, we put the actual current_frame back, so other
@@ -189,11 +762,39 @@ class Screen_Tracker_Online(Surface_Tracker):
             events["frame"] = current_frame
 
     def _update_surface_locations(self, frame_index):
-        for surface in self.surfaces:
-            surface.update_location(frame_index, self.markers, self.camera_model)
+        with self._profiler.measure("_update_surface_locations"):
+            if not isinstance(self.markers, Screen_Markers):
+                # set by the base tracker before the first detection
+                self.markers = Screen_Markers()
+            uids = self.markers.uids
+            verts = self.markers.corners
+            key = self.current_frame.index, self.current_frame.timestamp
+            stable = (
+                uids
+                and uids == self._located_marker_uids
+                and (
+                    key == self._located_frame_key
+                    or np.abs(verts - self._located_marker_verts).max() < self.location_reuse_epsilon
+                )
+            )
+            if not stable:
+                self._located_marker_uids = uids
+                self._located_marker_verts = verts
+                self._located_surfaces = weakref.WeakSet()
+            self._located_frame_key = key
+
+            for surface in self.surfaces:
+                if stable and surface.defined and surface in self._located_surfaces:
+                    # same corners as the last computed location, keep it
+                    self._profiler.count("location_reuse")
+                    continue
+                surface.update_location(frame_index, self.markers, self.camera_model)
+                self._located_surfaces.add(surface)
 
     def _update_surface_corners(self):
         for surface, corner_idx in self._edit_surf_verts:
+            # the surface definition changes, its location must be recomputed
+            self._located_surfaces.discard(surface)
             if surface.detected:
                 surface.move_corner(
                     corner_idx, self._last_mouse_pos.copy(), self.camera_model
@@ -201,27 +802,103 @@ class Screen_Tracker_Online(Surface_Tracker):
 
     def _update_surface_heatmaps(self):
         for surface in self.surfaces:
-            gaze_on_surf = surface.gaze_history
-            gaze_on_surf = (
-                g
-                for g in gaze_on_surf
-                if g["confidence"] >= self.g_pool.min_data_confidence
+            history = self._gaze_histories.get(surface)
+            if history is None:
+                continue
+            aspect_ratio = surface.real_world_size["y"] / surface.real_world_size["x"]
+            grid = (
+                max(1, int(surface._heatmap_resolution * aspect_ratio)),
+                int(surface._heatmap_resolution),
             )
-            gaze_on_surf = list(gaze_on_surf)
-            surface.update_heatmap(gaze_on_surf)
+            hist = history.histogram(grid, self.g_pool.min_data_confidence)
+            if history.changed:
+                update_surface_heatmap(surface, hist)
+                history.changed = False
+
+    def _create_surface_events(self, events, timestamp):
+        """
+        Maps the whole batch of gaze and fixations of this frame with one
+        perspective transform per surface, dicts are only built for the events.
+        """
+        gaze_events = events.get("gaze", [])
+        fixation_events = events.get("fixations", [])
+        gaze = gaze_batch(gaze_events)
+        fixations = gaze_batch(fixation_events)
+        gaze_points = undistorted_image_points(gaze[1], self.camera_model)
+        fixation_points = undistorted_image_points(fixations[1], self.camera_model)
+
+        self._gaze_on_surfaces = {}
+        surface_events = []
+        for surface in self.surfaces:
+            if not surface.detected:
+                continue
+
+            gaze_pos, gaze_on_surf = map_points_to_surface(gaze_points, surface.img_to_surf_trans)
+            fixation_pos, fixation_on_surf = map_points_to_surface(fixation_points, surface.img_to_surf_trans)
+
+            rows = np.empty((int(gaze_on_surf.sum()), 4), dtype=np.float64)
+            rows[:, 0] = gaze[0][gaze_on_surf]
+            rows[:, 1:3] = gaze_pos[gaze_on_surf]
+            rows[:, 3] = gaze[2][gaze_on_surf]
+            self._gaze_on_surfaces[surface] = rows
+
+            surface_events.append(
+                {
+                    "topic": "surfaces.{}".format(surface.name),
+                    "name": surface.name,
+                    "surf_to_img_trans": surface.surf_to_img_trans.tolist(),
+                    "img_to_surf_trans": surface.img_to_surf_trans.tolist(),
+                    "surf_to_dist_img_trans": surface.surf_to_dist_img_trans.tolist(),
+                    "dist_img_to_surf_trans": surface.dist_img_to_surf_trans.tolist(),
+                    "gaze_on_surfaces": surface_gaze_datums(
+                        gaze_events, gaze[0], gaze[2], gaze_pos, gaze_on_surf
+                    ),
+                    "fixations_on_surfaces": surface_gaze_datums(
+                        fixation_events, fixations[0], fixations[2], fixation_pos, fixation_on_surf
+                    ),
+                    "timestamp": timestamp,
+                }
+            )
+        return surface_events
 
     def _update_surface_gaze_history(self, events, world_timestamp):
-        surfaces_gaze_dict = {
-            e["name"]: e["gaze_on_surfaces"] for e in events["surfaces"]
-        }
-
         for surface in self.surfaces:
             try:
-                surface.update_gaze_history(
-                    surfaces_gaze_dict[surface.name], world_timestamp
-                )
+                rows = self._gaze_on_surfaces[surface]
             except KeyError:
-                pass
+                continue
+
+            try:
+                history = self._gaze_histories[surface]
+            except KeyError:
+                history = self._gaze_histories[surface] = Surface_Gaze_History()
+                # the surface window draws the recent gaze from gaze_history
+                surface.gaze_history = history.view
+            history.update(rows, world_timestamp, surface.gaze_history_length)
+
+    def _publish_surface_gaze(self):
+        if self._gaze_publisher is None:
+            # imported on demand, shared memory needs Python 3.8 and the module next to this one
+            try:
+                from surface_gaze_shm import Surface_Gaze_Writer
+            except ImportError as err:
+                logger.error("Surface gaze publishing is not available: {}".format(err))
+                self.publish_gaze_shm = False
+                return
+            try:
+                self._gaze_publisher = Surface_Gaze_Writer(self.gaze_shm_name)
+            except OSError as err:
+                logger.error("Can not publish surface gaze to shared memory: {}".format(err))
+                self.publish_gaze_shm = False
+                return
+            logger.info("Publishing surface gaze to shared memory '{}'".format(self.gaze_shm_name))
+        for surface, rows in self._gaze_on_surfaces.items():
+            self._gaze_publisher.publish(surface.name, rows)
+
+    def _stop_gaze_publisher(self):
+        if self._gaze_publisher is not None:
+            self._gaze_publisher.close()
+            self._gaze_publisher = None
 
     def on_add_surface_click(self, _=None):
         if self.freeze_scene:
@@ -244,6 +921,40 @@ class Screen_Tracker_Online(Surface_Tracker):
                     "Can not add a new surface: No markers found in the image!"
                 )
 
+    def _update_profiler_info(self):
+        if self._profiler_info is None:
+            return
+        if self._profiler.enabled and self._profiler.samples:
+            self._profiler_info.text = " | ".join(self._profiler.report())
+        else:
+            self._profiler_info.text = ""
+
+    def _save_profiler_report(self):
+        if not self._profiler.samples:
+            return
+        for line in self._profiler.report():
+            logger.info(line)
+        path = os.path.join(self.g_pool.user_dir, "screen_tracker_timings.csv")
+        try:
+            self._profiler.save(path)
+        except OSError:
+            logger.warning("Could not save screen tracker timings to {}".format(path))
+        else:
+            logger.info("Screen tracker timings saved to {}".format(path))
+
+    def get_init_dict(self):
+        d = super().get_init_dict()
+        for name in self.PERSISTENT_SETTINGS:
+            d[name] = getattr(self, name)
+        return d
+
+    def cleanup(self):
+        self._stop_detection_worker()
+        self._stop_gaze_publisher()
+        if self._profiler.enabled:
+            self._save_profiler_report()
+        super().cleanup()
+
     def gl_display(self):
         if self.freeze_scene:
             self.gl_display_frozen_scene()
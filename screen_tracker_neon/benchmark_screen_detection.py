@@ -0,0 +1,138 @@
+"""
+Headless benchmark for the screen tracker detection.
+
+Renders synthetic world frames with a bright screen quadrilateral under
+varied resolution, perspective, blur, noise and clutter, runs
+find_screens over them and reports per stage timings and the corner
+error against the rendered ground truth.
+
+    python benchmark_screen_detection.py --repeats 20 --pyramid-levels 0 1 2
+
+Detection only needs cv2 and numpy, Pupil's modules are not imported.
+"""
+import argparse
+import itertools
+import os
+import sys
+from time import perf_counter
+
+import cv2
+import numpy as np
+
+STAGES = ('threshold', 'findContours', 'filtering', 'approxPolyDP', 'cornerSubPix')
+
+RESOLUTIONS = {
+    '480p': (640, 480),
+    '720p': (1280, 720),
+    '1080p': (1920, 1080),
+}
+
+# name : (perspective, blur sigma, noise sigma, clutter shapes)
+CONDITIONS = {
+    'clean': (0.0, 0.0, 0.0, 0),
+    'perspective': (0.12, 0.0, 0.0, 0),
+    'blur': (0.05, 1.5, 0.0, 0),
+    'noise': (0.05, 0.0, 3.0, 0),
+    'clutter': (0.05, 0.0, 0.0, 400),
+    'all': (0.12, 1.5, 3.0, 400),
+}
+
+def import_screen_detection():
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import screen_detection
+    return screen_detection
+
+def render_frame(rng, resolution, perspective, blur, noise, clutter):
+    """
+    returns the gray frame and the ground truth corners (tl, tr, br, bl)
+    """
+    width, height = resolution
+    img = np.full((height, width), 70, dtype=np.uint8)
+
+    for _ in range(clutter):
+        x, y = rng.integers(0, width), rng.integers(0, height)
+        w, h = rng.integers(4, width // 20), rng.integers(4, height // 20)
+        color = int(rng.integers(0, 256))
+        if rng.random() < 0.5:
+            cv2.rectangle(img, (int(x), int(y)), (int(x + w), int(y + h)), color, -1)
+        else:
+            cv2.line(img, (int(x), int(y)), (int(x + w), int(y + h)), color, int(rng.integers(1, 4)))
+
+    # screen covers about half of the frame, corners jittered for perspective
+    cx, cy = width * rng.uniform(0.4, 0.6), height * rng.uniform(0.4, 0.6)
+    sw, sh = width * 0.5, height * 0.5
+    corners = np.array([
+        [cx - sw / 2, cy - sh / 2],
+        [cx + sw / 2, cy - sh / 2],
+        [cx + sw / 2, cy + sh / 2],
+        [cx - sw / 2, cy + sh / 2],
+    ])
+    corners += rng.uniform(-perspective, perspective, size=(4, 2)) * (sw, sh)
+
+    # keep clutter from touching the screen border
+    margin = corners + np.sign(corners - (cx, cy)) * 0.03 * min(sw, sh)
+    cv2.fillConvexPoly(img, np.int32(margin * 16), 70, lineType=cv2.LINE_AA, shift=4)
+    cv2.fillConvexPoly(img, np.int32(corners * 16), 230, lineType=cv2.LINE_AA, shift=4)
+
+    # some content on the screen
+    for _ in range(10):
+        u, v = rng.uniform(0.15, 0.85, size=2)
+        p = corners[0] + u * (corners[1] - corners[0]) + v * (corners[3] - corners[0])
+        cv2.circle(img, (int(p[0]), int(p[1])), int(sh * 0.03), int(rng.integers(100, 200)), -1)
+
+    if blur > 0:
+        img = cv2.GaussianBlur(img, (0, 0), blur)
+    if noise > 0:
+        img = np.clip(img + rng.normal(0, noise, img.shape), 0, 255).astype(np.uint8)
+    return img, np.float32(corners)
+
+def run_condition(detection, frames, pyramid_level, use_roi, roi_padding=0.25):
+    timings = {}
+    total = 0.
+    errors = []
+    for gray_img, truth in frames:
+        roi = detection.screen_search_roi(truth, gray_img.shape, roi_padding) if use_roi else None
+        start = perf_counter()
+        screens = detection.find_screens(gray_img, roi=roi, pyramid_level=pyramid_level, timings=timings)
+        total += perf_counter() - start
+        if screens:
+            errors.append(np.linalg.norm(screens[0] - truth, axis=1).max())
+
+    n = len(frames)
+    result = {stage: timings.get(stage, 0.) / n * 1000 for stage in STAGES}
+    result['total'] = total / n * 1000
+    result['detected'] = len(errors) / n
+    result['mean_error'] = float(np.mean(errors)) if errors else float('nan')
+    result['max_error'] = float(np.max(errors)) if errors else float('nan')
+    return result
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--resolutions', nargs='+', default=list(RESOLUTIONS), choices=list(RESOLUTIONS))
+    parser.add_argument('--conditions', nargs='+', default=list(CONDITIONS), choices=list(CONDITIONS))
+    parser.add_argument('--pyramid-levels', nargs='+', type=int, default=[0, 1, 2])
+    parser.add_argument('--roi', action='store_true', help='search around the ground truth corners')
+    parser.add_argument('--repeats', type=int, default=10, help='frames rendered per condition')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    detection = import_screen_detection()
+
+    columns = ('resolution', 'condition', 'level') + STAGES + ('total', 'detected', 'mean_error', 'max_error')
+    print('\t'.join(columns))
+    for resolution, condition in itertools.product(args.resolutions, args.conditions):
+        rng = np.random.default_rng(args.seed)
+        frames = [render_frame(rng, RESOLUTIONS[resolution], *CONDITIONS[condition]) for _ in range(args.repeats)]
+        # warm up OpenCV before timing
+        detection.find_screens(frames[0][0])
+        # find_screens caps the level for small frames
+        max_level = detection.max_pyramid_level(RESOLUTIONS[resolution][0])
+        for level in sorted(set(min(level, max_level) for level in args.pyramid_levels)):
+            result = run_condition(detection, frames, level, args.roi)
+            row = [resolution, condition, str(level)]
+            row += ['{:.2f}'.format(result[c]) for c in STAGES + ('total',)]
+            row += ['{:.2f}'.format(result['detected']), '{:.3f}'.format(result['mean_error']), '{:.3f}'.format(result['max_error'])]
+            print('\t'.join(row))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,41 @@
+"""
+Detects the screen in every frame of a recorded world video and writes the
+corners next to it (<video>_screen_corners.npy). Screen_Tracker_Online uses
+that cache instead of detecting again when the video is played back.
+
+Only cv2 and numpy are needed, Pupil's modules are not imported:
+
+    python detect_screens_offline.py recording/world.mp4
+"""
+import argparse
+import logging
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from screen_detection import detect_screen_corners_in_video
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('video', help='world video, e.g. world.mp4')
+    parser.add_argument('--cache', default=None, help='output path, next to the video by default')
+    parser.add_argument('--workers', type=int, default=None, help='processes, one per cpu by default')
+    parser.add_argument('--chunk-size', type=int, default=900, help='frames per task')
+    parser.add_argument('--roi-padding', type=float, default=0.25)
+    parser.add_argument('--pyramid-level', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.DEBUG, format='%(asctime)s %(message)s')
+    cache_path = detect_screen_corners_in_video(
+        args.video,
+        cache_path=args.cache,
+        workers=args.workers,
+        chunk_size=args.chunk_size,
+        roi_padding=args.roi_padding,
+        pyramid_level=args.pyramid_level,
+    )
+    print(cache_path)
+
+if __name__ == '__main__':
+    main()
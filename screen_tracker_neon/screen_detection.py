@@ -0,0 +1,707 @@
+"""
+Screen detection without Pupil's GUI modules.
+
+Finding the screen corners in a gray world frame, carrying them between
+frames, stable screen ids, the background worker, the detection budget
+governor and the offline corner cache of a recorded video. Only cv2 and
+numpy are needed, Screen_Tracker_Online, the offline batch detection and
+the benchmark use this module.
+"""
+import logging
+logger = logging.getLogger(__name__)
+
+import os
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from time import perf_counter
+
+import cv2
+import numpy as np
+
+def sortCorners(corners, center):
+    """
+    corners : list of points
+    center : point
+    """
+    top = [corner for corner in corners if corner[1] < center[1]]
+    bot = [corner for corner in corners if corner[1] >= center[1]]
+
+    corners = np.zeros(shape=(4,2))
+
+    if (len(top) == 2) and (len(bot) == 2):
+        tl, tr = sorted(top, key=lambda p: p[0])
+        bl, br = sorted(bot, key=lambda p: p[0])
+
+    corners[0] = np.array(tl)
+    corners[1] = np.array(tr)
+    corners[2] = np.array(br)
+    corners[3] = np.array(bl)
+
+    return corners
+
+def screen_search_roi(verts, frame_shape, padding=0.25):
+    """
+    verts : screen corners in image pixels
+    frame_shape : shape of the gray image
+    padding : fraction of the screen size added to each side
+
+    returns the (x, y, w, h) search region around the screen, clipped to the frame
+    """
+    verts = np.asarray(verts, dtype=np.float32).reshape(-1, 2)
+    x_min, y_min = verts.min(axis=0)
+    x_max, y_max = verts.max(axis=0)
+    pad_x = (x_max - x_min) * padding
+    pad_y = (y_max - y_min) * padding
+
+    frame_h, frame_w = frame_shape[:2]
+    x0 = int(max(0, np.floor(x_min - pad_x)))
+    y0 = int(max(0, np.floor(y_min - pad_y)))
+    x1 = int(min(frame_w, np.ceil(x_max + pad_x)))
+    y1 = int(min(frame_h, np.ceil(y_max + pad_y)))
+    return x0, y0, x1 - x0, y1 - y0
+
+criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 100, 0.001)
+
+# smallest accepted screen area, in pixels of a 1280x720 world frame
+SCREEN_MIN_AREA = 20 * 2500
+SCREEN_MIN_AREA_FRAME_SIZE = 1280 * 720
+
+def screen_min_area(frame_shape, pyramid_level=0):
+    """
+    Scales SCREEN_MIN_AREA to the frame size and to the area of one
+    pixel at the given pyramid level.
+    """
+    frame_area = frame_shape[0] * frame_shape[1]
+    return SCREEN_MIN_AREA * frame_area / SCREEN_MIN_AREA_FRAME_SIZE / 4**pyramid_level
+
+# narrowest search image, in pixels of the frame width, that keeps corners
+# sub-pixel accurate in clutter (benchmark_screen_detection.py --roi)
+MIN_SEARCH_WIDTH = 480
+
+def max_pyramid_level(frame_width):
+    """
+    returns the coarsest pyramid level with a search image at least
+    MIN_SEARCH_WIDTH wide
+    """
+    level = 0
+    while frame_width // 2**(level + 1) >= MIN_SEARCH_WIDTH:
+        level += 1
+    return level
+
+def _add_stage_time(timings, stage, start):
+    """
+    Accumulates the time since start into timings[stage], returns the current time.
+    """
+    now = perf_counter()
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.) + now - start
+    return now
+
+def screen_quad_candidates(contours, hierarchy, min_area, timings=None):
+    """
+    contours, hierarchy : findContours output (RETR_TREE), hierarchy without
+        the extra encapsulation
+    min_area : smallest accepted screen area
+    timings : optional dict, receives the seconds spent filtering and in approxPolyDP
+
+    Cheap array tests run over all contours first, per contour OpenCV calls
+    only for the few that survive them.
+
+    returns a list of (quad, score), quad as returned by approxPolyDP
+    """
+    start = perf_counter()
+    # keep only contours with parents and children
+    idx = np.flatnonzero((hierarchy[:, 3] >= 0) & (hierarchy[:, 2] >= 0))
+    if idx.size == 0:
+        _add_stage_time(timings, 'filtering', start)
+        return []
+
+    # bounding rects and perimeters of all remaining contours in one pass
+    selected = [contours[i] for i in idx]
+    lengths = np.fromiter((len(c) for c in selected), dtype=np.intp, count=len(selected))
+    # a contour with less than 4 points can not be a screen
+    keep = lengths >= 4
+    if not keep.any():
+        _add_stage_time(timings, 'filtering', start)
+        return []
+    selected = [c for c, k in zip(selected, keep) if k]
+    lengths = lengths[keep]
+
+    points = np.concatenate(selected).reshape(-1, 2).astype(np.float32)
+    starts = np.zeros_like(lengths)
+    np.cumsum(lengths[:-1], out=starts[1:])
+
+    width = np.maximum.reduceat(points[:, 0], starts) - np.minimum.reduceat(points[:, 0], starts)
+    height = np.maximum.reduceat(points[:, 1], starts) - np.minimum.reduceat(points[:, 1], starts)
+
+    # closed perimeter, the last point of each contour connects to its first
+    steps = np.empty_like(points)
+    steps[:-1] = points[1:] - points[:-1]
+    ends = starts + lengths - 1
+    steps[ends] = points[starts] - points[ends]
+    perimeter = np.add.reduceat(np.hypot(steps[:, 0], steps[:, 1]), starts)
+
+    # the contour area is bounded by its bounding rect, a square is the
+    # quadrilateral with the smallest perimeter for a given area
+    keep = (width * height > min_area) & (perimeter > 4. * np.sqrt(min_area))
+
+    quads = []
+    for c, p in zip((c for c, k in zip(selected, keep) if k), perimeter[keep]):
+        area = cv2.contourArea(c)
+        if area <= min_area:
+            continue
+        start = _add_stage_time(timings, 'filtering', start)
+        quad = cv2.approxPolyDP(c, p*0.1, True)
+        start = _add_stage_time(timings, 'approxPolyDP', start)
+        if quad.shape[0] != 4 or not cv2.isContourConvex(quad):
+            continue
+        quad_area = cv2.contourArea(quad)
+        if quad_area <= 0:
+            continue
+        # prefer large contours that fill their quadrilateral
+        fill = area / quad_area
+        quads.append((quad, quad_area * min(fill, 1. / fill)))
+    _add_stage_time(timings, 'filtering', start)
+    return quads
+
+def find_screens(gray_img, roi=None, pyramid_level=0, timings=None, block_size=25):
+    """
+    gray_img : full world frame
+    roi : optional (x, y, w, h) region to search, the whole frame if None
+    pyramid_level : number of times the search image is halved before
+        looking for the screen contours, corners are refined at full resolution.
+        Capped at max_pyramid_level of the frame width.
+    block_size : adaptive threshold neighbourhood in full resolution pixels
+    timings : optional dict, receives the seconds spent per detection stage
+
+    All screens are found in one threshold and contour pass.
+
+    returns a list of sorted (tl, tr, br, bl) corner arrays in full frame
+    coordinates, best scoring screen first
+    """
+    start = perf_counter()
+    if roi is None:
+        search_img, offset = gray_img, (0, 0)
+    else:
+        x, y, w, h = roi
+        search_img, offset = gray_img[y:y+h, x:x+w], (x, y)
+
+    pyramid_level = min(pyramid_level, max_pyramid_level(gray_img.shape[1]))
+    for _ in range(pyramid_level):
+        search_img = cv2.pyrDown(search_img)
+    scale = 2**pyramid_level
+    block_size = max(3, (int(block_size) // scale) | 1)
+
+    edges = cv2.adaptiveThreshold(search_img, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY_INV, block_size, -5)
+    start = _add_stage_time(timings, 'threshold', start)
+
+    *_, contours, hierarchy = cv2.findContours(edges,
+                                    mode=cv2.RETR_TREE,
+                                    method=cv2.CHAIN_APPROX_SIMPLE,offset=(0,0)) #TC89_KCOS
+    _add_stage_time(timings, 'findContours', start)
+
+    if hierarchy is None:
+        return []
+
+    # if draw_contours:
+    #     cv2.drawContours(gray_img, contours,-1, (0,0,0))
+
+    # remove extra encapsulation
+    hierarchy = hierarchy[0]
+    min_area = screen_min_area(gray_img.shape, pyramid_level)
+    quads = screen_quad_candidates(contours, hierarchy, min_area, timings)
+
+    # best scoring first, nested or overlapping candidates belong to a screen already taken
+    rect_cand = []
+    centers = []
+    for quad, _ in sorted(quads, key=lambda q: q[1], reverse=True):
+        center = tuple(quad.reshape(4, 2).mean(axis=0).tolist())
+        if any(
+            cv2.pointPolygonTest(taken, center, False) >= 0
+            or cv2.pointPolygonTest(quad, taken_center, False) >= 0
+            for taken, taken_center in zip(rect_cand, centers)
+        ):
+            continue
+        rect_cand.append(quad)
+        centers.append(center)
+
+    screens = []
+    for r in rect_cand:
+        r = np.float32(r) * scale + np.float32(offset)
+        start = perf_counter()
+        if scale > 1:
+            # the window has to cover the error of the upscaled estimate, it
+            # also picks up structure next to the screen, the second pass
+            # refines with the full resolution window
+            cv2.cornerSubPix(gray_img, r, (3 * scale, 3 * scale), (-1,-1), criteria)
+        cv2.cornerSubPix(gray_img, r, (3,3), (-1,-1), criteria)
+        _add_stage_time(timings, 'cornerSubPix', start)
+        corners = np.array([r[0][0], r[1][0], r[2][0], r[3][0]])
+        centroid = corners.sum(axis=0, dtype='float64')*0.25
+        centroid.shape = (2)
+
+        screens.append(np.float32(sortCorners(corners, centroid)))
+    return screens
+
+lk_params = dict(winSize=(21, 21), maxLevel=3,
+                 criteria=(cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 30, 0.01))
+
+def track_screen_corners(prev_gray, gray_img, corners, predicted=None, max_error=1.):
+    """
+    Carries the screen corners from the previous to the current frame with
+    pyramidal Lucas-Kanade flow.
+
+    predicted : optional initial guess for the corner positions in the current frame
+    max_error : largest accepted forward-backward error in pixels
+
+    returns the corners with the shape they were given and the largest
+    forward-backward error, None when any corner is lost
+    """
+    shape = np.shape(corners)
+    prev_pts = np.float32(corners).reshape(-1, 1, 2)
+    if predicted is None:
+        next_pts, flags = None, 0
+    else:
+        next_pts, flags = np.float32(predicted).reshape(-1, 1, 2), cv2.OPTFLOW_USE_INITIAL_FLOW
+
+    next_pts, status, _ = cv2.calcOpticalFlowPyrLK(prev_gray, gray_img, prev_pts, next_pts, flags=flags, **lk_params)
+    if next_pts is None or not status.all():
+        return None
+
+    back_pts, back_status, _ = cv2.calcOpticalFlowPyrLK(gray_img, prev_gray, next_pts, None, **lk_params)
+    if back_pts is None or not back_status.all():
+        return None
+
+    fb_error = np.linalg.norm(back_pts - prev_pts, axis=2).max()
+    if fb_error > max_error:
+        return None
+    return next_pts.reshape(shape), fb_error
+
+class Screen_Corner_Filter(object):
+    """
+    Constant velocity (alpha-beta) filter over the screen corners.
+    Predicts where the corners go next and smooths measurement jitter.
+    """
+    def __init__(self, alpha=0.6, beta=0.2, max_jump=20.):
+        self.alpha = alpha
+        self.beta = beta
+        self.max_jump = max_jump # pixels, larger innovations restart the filter
+        self.reset()
+
+    def reset(self, corners=None):
+        self.corners = None if corners is None else np.float32(corners)
+        self.velocity = None if corners is None else np.zeros_like(self.corners)
+
+    def predict(self):
+        if self.corners is None:
+            return None
+        return self.corners + self.velocity
+
+    def update(self, measured):
+        measured = np.float32(measured)
+        predicted = self.predict()
+        if predicted is None or predicted.shape != measured.shape:
+            self.reset(measured)
+            return self.corners
+
+        innovation = measured - predicted
+        if np.abs(innovation).max() > self.max_jump:
+            self.reset(measured)
+            return self.corners
+
+        self.corners = predicted + self.alpha * innovation
+        self.velocity = self.velocity + self.beta * innovation
+        return self.corners
+
+def search_screen_corners(gray_img, roi=None, pyramid_level=0, expected_screens=1, block_size=25):
+    """
+    Looks for the screens inside roi first and in the whole frame when
+    fewer than expected_screens are found there.
+
+    returns a list of corner arrays, see find_screens
+    """
+    screens = find_screens(gray_img, roi=roi, pyramid_level=pyramid_level, block_size=block_size)
+    if len(screens) < max(1, expected_screens) and roi is not None:
+        # tracking lost, fall back to a full frame search
+        screens = find_screens(gray_img, pyramid_level=pyramid_level, block_size=block_size)
+    return screens
+
+def _screen_boxes(screens):
+    screens = np.asarray(screens, dtype=np.float32).reshape(-1, 4, 2)
+    return np.concatenate([screens.min(axis=1), screens.max(axis=1)], axis=1)
+
+class Screen_Identities(object):
+    """
+    Gives every screen a marker id that stays the same across frames.
+    Screens are matched to the screens seen before by bounding box overlap,
+    unmatched screens get the lowest free id. Ids of screens that are not
+    seen for max_lost_frames are released.
+    """
+    def __init__(self, first_id=32, min_iou=0.3, max_lost_frames=30):
+        self.first_id = first_id
+        self.min_iou = min_iou
+        self.max_lost_frames = max_lost_frames
+        self.reset()
+
+    def reset(self):
+        self._boxes = {}
+        self._lost = {}
+
+    def assign(self, screens):
+        """
+        returns one id per screen
+        """
+        ids = [None] * len(screens)
+        known = list(self._boxes)
+        if len(screens) and known:
+            boxes = _screen_boxes(screens)
+            prev = np.array([self._boxes[i] for i in known])
+            x0 = np.maximum(boxes[:, None, 0], prev[None, :, 0])
+            y0 = np.maximum(boxes[:, None, 1], prev[None, :, 1])
+            x1 = np.minimum(boxes[:, None, 2], prev[None, :, 2])
+            y1 = np.minimum(boxes[:, None, 3], prev[None, :, 3])
+            inter = np.clip(x1 - x0, 0, None) * np.clip(y1 - y0, 0, None)
+            area = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+            prev_area = (prev[:, 2] - prev[:, 0]) * (prev[:, 3] - prev[:, 1])
+            iou = inter / np.maximum(area[:, None] + prev_area[None, :] - inter, 1e-6)
+
+            taken = set()
+            for flat in np.argsort(-iou, axis=None):
+                i, j = np.unravel_index(flat, iou.shape)
+                if iou[i, j] < self.min_iou:
+                    break
+                if ids[i] is None and j not in taken:
+                    ids[i] = known[j]
+                    taken.add(j)
+
+        free_id = self.first_id
+        for i in range(len(screens)):
+            if ids[i] is None:
+                while free_id in self._boxes or free_id in ids:
+                    free_id += 1
+                ids[i] = free_id
+
+        seen = set(ids)
+        for marker_id in known:
+            if marker_id not in seen:
+                self._lost[marker_id] += 1
+                if self._lost[marker_id] > self.max_lost_frames:
+                    del self._boxes[marker_id]
+                    del self._lost[marker_id]
+        if len(screens):
+            for marker_id, box in zip(ids, _screen_boxes(screens)):
+                self._boxes[marker_id] = box
+                self._lost[marker_id] = 0
+        return ids
+
+Screen_Detection = namedtuple('Screen_Detection', ['frame_index', 'timestamp', 'screens'])
+
+def _search_screen_corners_job(frame_index, timestamp, gray_img, kwargs):
+    return Screen_Detection(frame_index, timestamp, search_screen_corners(gray_img, **kwargs))
+
+class Screen_Detection_Worker(object):
+    """
+    Runs the screen search on a background thread, OpenCV releases the GIL
+    while it works. At most one frame is processed and one frame waits,
+    a newer frame replaces the waiting one (latest frame wins).
+    """
+    def __init__(self):
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._running = None
+        self._waiting = None
+        self.result = None
+        self.dropped_frames = 0
+
+    def submit(self, frame_index, timestamp, gray_img, **kwargs):
+        # the capture backend may reuse the frame buffer, work on a copy
+        job = (frame_index, timestamp, gray_img.copy(), kwargs)
+        if self._running is None:
+            self._running = self._executor.submit(_search_screen_corners_job, *job)
+        else:
+            if self._waiting is not None:
+                self.dropped_frames += 1
+            self._waiting = job
+
+    def poll(self):
+        """
+        returns the newest completed Screen_Detection or None
+        """
+        if self._running is not None and self._running.done():
+            try:
+                result = self._running.result()
+            except Exception:
+                logger.exception("Screen detection failed in the background.")
+            else:
+                if self.result is None or result.frame_index > self.result.frame_index:
+                    self.result = result
+            self._running = None
+
+            if self._waiting is not None:
+                self._running = self._executor.submit(_search_screen_corners_job, *self._waiting)
+                self._waiting = None
+        return self.result
+
+    def stop(self):
+        self._waiting = None
+        self._executor.shutdown(wait=False)
+
+class Detection_Budget_Governor(object):
+    """
+    Keeps the world loop time spent on screen detection under budget, a
+    share of the world frame interval, by walking a ladder of detection
+    settings. Every rung is one notch cheaper than the one before: less
+    region padding, a coarser pyramid level, a smaller threshold block or
+    more frames between detections, in turns until all reach the cheap
+    bound. The governor steps down when the smoothed load is over budget
+    and back up when it is below headroom * budget. After a change it
+    waits cooldown frames so the load reflects the new settings.
+
+    Knobs without effect in the tracker's current mode are left at best,
+    see set_knobs, so no rung waits a cooldown without cutting cost.
+
+    best, cheapest : settings dicts bounding the ladder, keys are KNOBS
+    """
+    KNOBS = ("roi_padding", "detection_pyramid_level", "detection_block_size", "redetection_interval")
+    STEPS = {
+        "roi_padding": 0.05,
+        "detection_pyramid_level": 1,
+        "detection_block_size": 4,
+        "redetection_interval": 2,
+    }
+
+    def __init__(self, budget=0.3, best=None, cheapest=None, smoothing=0.1, cooldown=30, headroom=0.5):
+        self.budget = budget
+        self.best = {
+            "roi_padding": 0.25,
+            "detection_pyramid_level": 0,
+            "detection_block_size": 25,
+            "redetection_interval": 5,
+        }
+        self.best.update(best or {})
+        self.cheapest = {
+            "roi_padding": 0.1,
+            "detection_pyramid_level": 2,
+            "detection_block_size": 11,
+            "redetection_interval": 15,
+        }
+        self.cheapest.update(cheapest or {})
+        self.smoothing = smoothing
+        self.cooldown = cooldown
+        self.headroom = headroom
+        self._bounds = None
+        self.ladder = self._settings_ladder(self.cheapest)
+        self.reset()
+
+    def set_knobs(self, knobs, max_pyramid_level=None):
+        """
+        knobs : the KNOBS that change the detection cost in the current mode
+        max_pyramid_level : coarsest level find_screens uses for the frame size
+
+        returns True when the ladder was rebuilt, the level is back at the
+        best settings then
+        """
+        bounds = tuple(knob for knob in self.KNOBS if knob in knobs), max_pyramid_level
+        if bounds == self._bounds:
+            return False
+        self._bounds = bounds
+        cheapest = {knob: self.cheapest[knob] if knob in bounds[0] else self.best[knob] for knob in self.KNOBS}
+        if max_pyramid_level is not None:
+            cheapest["detection_pyramid_level"] = max(
+                self.best["detection_pyramid_level"], min(cheapest["detection_pyramid_level"], max_pyramid_level)
+            )
+        self.ladder = self._settings_ladder(cheapest)
+        self.reset()
+        return True
+
+    def _settings_ladder(self, cheapest):
+        current = dict(self.best)
+        ladder = [dict(current)]
+        while current != cheapest:
+            for knob in self.KNOBS:
+                target = cheapest[knob]
+                if current[knob] == target:
+                    continue
+                step = self.STEPS[knob] if target > current[knob] else -self.STEPS[knob]
+                value = current[knob] + step
+                if (value - target) * step > 0:
+                    value = target
+                current[knob] = round(value, 6) if isinstance(value, float) else value
+                ladder.append(dict(current))
+        return ladder
+
+    def reset(self):
+        self.level = 0
+        self.load = None
+        self._frame_interval = None
+        self._last_timestamp = None
+        self._frames_since_change = 0
+
+    @property
+    def settings(self):
+        return self.ladder[self.level]
+
+    def update(self, timestamp, detection_time):
+        """
+        timestamp : world frame timestamp
+        detection_time : seconds spent on the frame's detection
+
+        returns True when the level changed, read the new settings
+        """
+        interval = None if self._last_timestamp is None else timestamp - self._last_timestamp
+        self._last_timestamp = timestamp
+        # skip pauses and jumps of a played back video
+        if interval is None or not 0 < interval < 1.:
+            return False
+        if self._frame_interval is None:
+            self._frame_interval = interval
+        else:
+            self._frame_interval += self.smoothing * (interval - self._frame_interval)
+
+        load = detection_time / self._frame_interval
+        self.load = load if self.load is None else self.load + self.smoothing * (load - self.load)
+
+        self._frames_since_change += 1
+        if self._frames_since_change < self.cooldown:
+            return False
+        if self.load > self.budget and self.level < len(self.ladder) - 1:
+            self.level += 1
+        elif self.load < self.headroom * self.budget and self.level > 0:
+            self.level -= 1
+        else:
+            return False
+        self._frames_since_change = 0
+        return True
+
+# per frame screen corners of a recorded world video, up to
+# SCREEN_CORNER_CACHE_MAX_SCREENS screens per frame, best scoring first
+SCREEN_CORNER_CACHE_MAX_SCREENS = 4
+SCREEN_CORNER_CACHE_DTYPE = np.dtype([
+    ("timestamp", np.float64),
+    ("confidence", np.float32, (SCREEN_CORNER_CACHE_MAX_SCREENS,)),
+    ("corners", np.float32, (SCREEN_CORNER_CACHE_MAX_SCREENS, 4, 2)),
+])
+
+def screen_corner_cache_path(video_path):
+    return os.path.splitext(video_path)[0] + "_screen_corners.npy"
+
+def load_screen_corner_cache(cache_path):
+    """
+    returns the memory mapped cache or None if there is none
+    """
+    if not os.path.exists(cache_path):
+        return None
+    cache = np.load(cache_path, mmap_mode="r")
+    if cache.dtype != SCREEN_CORNER_CACHE_DTYPE:
+        logger.warning("Ignoring screen corner cache with unknown layout: {}".format(cache_path))
+        return None
+    return cache
+
+def _open_video_at(video_path, start):
+    """
+    returns a capture whose next read() decodes frame start
+
+    Seeking is only frame exact for intra-only codecs, FFmpeg may land on
+    a nearby keyframe of H.264/H.265 video. The position of the decoded
+    frame is checked, when it is off the video is decoded from the first
+    frame instead.
+    """
+    capture = cv2.VideoCapture(video_path)
+    if start == 0:
+        return capture
+    capture.set(cv2.CAP_PROP_POS_FRAMES, start)
+    if int(capture.get(cv2.CAP_PROP_POS_FRAMES)) == start:
+        return capture
+
+    logger.debug("Seeking {} to frame {} is not exact, decoding from the start".format(video_path, start))
+    capture.release()
+    capture = cv2.VideoCapture(video_path)
+    for _ in range(start):
+        if not capture.grab():
+            break
+    position = int(capture.get(cv2.CAP_PROP_POS_FRAMES))
+    if position != start:
+        capture.release()
+        raise RuntimeError("Can not position {} at frame {}, decoding stopped at {}".format(video_path, start, position))
+    return capture
+
+def _detect_screen_corners_in_chunk(video_path, cache_path, start, stop, roi_padding, pyramid_level):
+    cache = np.load(cache_path, mmap_mode="r+")
+    capture = _open_video_at(video_path, start)
+
+    screens = []
+    for index in range(start, stop):
+        ok, img = capture.read()
+        if not ok:
+            break
+        gray_img = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        roi = screen_search_roi(screens, gray_img.shape, roi_padding) if screens else None
+        screens = search_screen_corners(
+            gray_img, roi=roi, pyramid_level=pyramid_level, expected_screens=len(screens)
+        )[:SCREEN_CORNER_CACHE_MAX_SCREENS]
+        if screens:
+            cache["corners"][index, :len(screens)] = screens
+            cache["confidence"][index, :len(screens)] = 1.
+
+    capture.release()
+    cache.flush()
+    return start, stop
+
+def detect_screen_corners_in_video(
+    video_path,
+    cache_path=None,
+    timestamps=None,
+    workers=None,
+    chunk_size=900,
+    roi_padding=0.25,
+    pyramid_level=0,
+):
+    """
+    Detects the screen in every frame of a recorded world video. Frame ranges
+    are processed in parallel and written into a memory mapped cache, see
+    SCREEN_CORNER_CACHE_DTYPE. Empty screen slots have confidence 0.
+
+    timestamps : world timestamps, read from <video>_timestamps.npy if None
+
+    returns the cache path
+    """
+    if cache_path is None:
+        cache_path = screen_corner_cache_path(video_path)
+    if timestamps is None:
+        timestamps_path = os.path.splitext(video_path)[0] + "_timestamps.npy"
+        if os.path.exists(timestamps_path):
+            timestamps = np.load(timestamps_path)
+        else:
+            capture = cv2.VideoCapture(video_path)
+            timestamps = np.full(int(capture.get(cv2.CAP_PROP_FRAME_COUNT)), np.nan)
+            capture.release()
+
+    # written to a temporary file first, an interrupted run leaves no cache behind
+    part_path = cache_path + ".part"
+    cache = np.lib.format.open_memmap(
+        part_path, mode="w+", dtype=SCREEN_CORNER_CACHE_DTYPE, shape=(len(timestamps),)
+    )
+    cache["timestamp"] = timestamps
+    cache["confidence"] = 0.
+    cache["corners"] = np.nan
+    cache.flush()
+    del cache
+
+    chunks = [(start, min(start + chunk_size, len(timestamps))) for start in range(0, len(timestamps), chunk_size)]
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(
+                    _detect_screen_corners_in_chunk, video_path, part_path, start, stop, roi_padding, pyramid_level
+                )
+                for start, stop in chunks
+            ]
+            for done, future in enumerate(as_completed(futures), 1):
+                start, stop = future.result()
+                logger.debug("Screen corners of frames {}-{} done ({}/{})".format(start, stop, done, len(chunks)))
+    except Exception:
+        # corners written against the wrong frames are worse than no cache
+        os.remove(part_path)
+        raise
+
+    os.replace(part_path, cache_path)
+    return cache_path
@@ -0,0 +1,230 @@
+"""
+Gaze on surfaces: the per frame batch mapping of gaze and fixations and the
+ring buffered gaze history of every surface with its heatmap histogram.
+Only cv2 and numpy are needed.
+"""
+import cv2
+import numpy as np
+
+class Gaze_History_Buffer(object):
+    """
+    Preallocated ring buffer of (timestamp, x, y, confidence) rows, oldest first.
+    Doubles its capacity when full.
+    """
+    def __init__(self, capacity=2048):
+        self._data = np.empty((capacity, 4), dtype=np.float64)
+        self._start = 0
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def _segments(self):
+        end = self._start + self._size
+        capacity = len(self._data)
+        if end <= capacity:
+            return self._data[self._start:end], self._data[:0]
+        return self._data[self._start:], self._data[:end - capacity]
+
+    def samples(self):
+        """
+        returns a copy of all rows, oldest first
+        """
+        return np.concatenate(self._segments())
+
+    def append(self, rows):
+        n = len(rows)
+        if n == 0:
+            return
+        if self._size + n > len(self._data):
+            data = self.samples()
+            capacity = len(self._data)
+            while self._size + n > capacity:
+                capacity *= 2
+            self._data = np.empty((capacity, 4), dtype=np.float64)
+            self._data[:self._size] = data
+            self._start = 0
+
+        capacity = len(self._data)
+        first = (self._start + self._size) % capacity
+        head = min(n, capacity - first)
+        self._data[first:first + head] = rows[:head]
+        self._data[:n - head] = rows[head:]
+        self._size += n
+
+    def evict_older_than(self, timestamp):
+        """
+        Drops the leading rows with timestamps up to timestamp, rows are
+        appended in time order.
+
+        returns a copy of the evicted rows
+        """
+        head, tail = self._segments()
+        n = int(np.searchsorted(head[:, 0], timestamp, side="right"))
+        if n < len(head):
+            evicted = head[:n].copy()
+        else:
+            n_tail = int(np.searchsorted(tail[:, 0], timestamp, side="right"))
+            evicted = np.concatenate((head, tail[:n_tail]))
+            n += n_tail
+        if n == 0:
+            return evicted
+        self._start = (self._start + n) % len(self._data)
+        self._size -= n
+        return evicted
+
+class Gaze_History_View(object):
+    """
+    Read only stand-in for Surface.gaze_history, the on surface gaze datums
+    of the last gaze_history_length seconds. The datums are built from the
+    ring buffer when they are read, e.g. by the surface window.
+    """
+    def __init__(self, buffer):
+        self._buffer = buffer
+
+    def __len__(self):
+        return len(self._buffer)
+
+    @staticmethod
+    def _datum(row):
+        timestamp, x, y, confidence = row
+        return {"norm_pos": (x, y), "confidence": confidence, "on_surf": True, "timestamp": timestamp}
+
+    def __iter__(self):
+        return map(self._datum, self._buffer.samples().tolist())
+
+    def __getitem__(self, index):
+        rows = self._buffer.samples()[index]
+        if isinstance(index, slice):
+            return [self._datum(row) for row in rows.tolist()]
+        return self._datum(rows.tolist())
+
+class Surface_Gaze_History(object):
+    """
+    Gaze on one surface for the last gaze_history_length seconds and its
+    heatmap histogram, updated by adding new and subtracting evicted samples.
+    """
+    def __init__(self):
+        self.buffer = Gaze_History_Buffer()
+        self.view = Gaze_History_View(self.buffer)
+        self._hist = None
+        self._grid = None
+        self._min_confidence = None
+        self.changed = True
+
+    def _bin_counts(self, rows):
+        rows = rows[rows[:, 3] >= self._min_confidence]
+        h, w = self._grid
+        # same binning as np.histogram2d over [0, 1], the upper edge is inclusive
+        ix = np.minimum((rows[:, 1] * w).astype(np.intp), w - 1)
+        iy = np.minimum(((1. - rows[:, 2]) * h).astype(np.intp), h - 1)
+        return np.bincount(iy * w + ix, minlength=h * w).reshape(h, w)
+
+    def update(self, rows, world_timestamp, history_length):
+        """
+        rows : (n, 4) timestamp, x, y, confidence of gaze on the surface
+        """
+        evicted = self.buffer.evict_older_than(world_timestamp - history_length)
+        rows = rows[rows[:, 0] > world_timestamp - history_length]
+        self.buffer.append(rows)
+        if self._hist is not None:
+            if len(rows):
+                self._hist += self._bin_counts(rows)
+            if len(evicted):
+                self._hist -= self._bin_counts(evicted)
+        self.changed = self.changed or len(rows) > 0 or len(evicted) > 0
+
+    def histogram(self, grid, min_confidence):
+        if self._hist is None or grid != self._grid or min_confidence != self._min_confidence:
+            self._grid = grid
+            self._min_confidence = min_confidence
+            self._hist = self._bin_counts(self.buffer.samples())
+            self.changed = True
+        return self._hist
+
+def update_surface_heatmap(surface, hist):
+    """
+    Same rendering as Surface.update_heatmap, from a precomputed histogram.
+    """
+    grid = hist.shape
+    if hist.any():
+        filter_h = int(surface._heatmap_blur_factor * grid[0]) // 2 * 2 + 1
+        filter_w = int(surface._heatmap_blur_factor * grid[1]) // 2 * 2 + 1
+        hist = cv2.GaussianBlur(hist.astype(np.float64), (filter_h, filter_w), 0)
+        hist_max = hist.max()
+        hist *= (255.0 / hist_max) if hist_max else 0.0
+        hist = hist.astype(np.uint8)
+    else:
+        hist = np.zeros(grid, dtype=np.uint8)
+
+    c_map = cv2.applyColorMap(hist, cv2.COLORMAP_JET)
+    # reuse allocated memory if possible
+    if surface.within_surface_heatmap.shape != (*grid, 4):
+        surface.within_surface_heatmap = np.ones((*grid, 4), dtype=np.uint8)
+        surface.within_surface_heatmap[:, :, 3] = 125
+    surface.within_surface_heatmap[:, :, :3] = c_map
+
+def gaze_batch(events):
+    """
+    Collects gaze or fixation events into arrays, one pass over the datums.
+
+    returns timestamps (n,), norm_pos (n, 2), confidence (n,)
+    """
+    n = len(events)
+    timestamps = np.empty(n, dtype=np.float64)
+    norm_pos = np.empty((n, 2), dtype=np.float64)
+    confidence = np.empty(n, dtype=np.float64)
+    for i, e in enumerate(events):
+        timestamps[i] = e["timestamp"]
+        norm_pos[i] = e["norm_pos"]
+        confidence[i] = e["confidence"]
+    return timestamps, norm_pos, confidence
+
+def undistorted_image_points(norm_pos, camera_model):
+    """
+    Denormalizes (flipped y) and undistorts all points at once, the result
+    is shared by every surface.
+    """
+    if len(norm_pos) == 0:
+        return np.empty((0, 2), dtype=np.float64)
+    width, height = camera_model.resolution
+    points = np.empty_like(norm_pos)
+    points[:, 0] = norm_pos[:, 0] * width
+    points[:, 1] = (1. - norm_pos[:, 1]) * height
+    return camera_model.undistort_points_on_image_plane(points).reshape(-1, 2)
+
+def map_points_to_surface(img_points, img_to_surf_trans):
+    """
+    returns the surface positions (n, 2) and the on surface mask (n,)
+    """
+    if len(img_points) == 0:
+        return np.empty((0, 2), dtype=np.float64), np.empty(0, dtype=bool)
+    surf_pos = cv2.perspectiveTransform(
+        img_points.reshape(-1, 1, 2).astype(np.float64), np.asarray(img_to_surf_trans, dtype=np.float64)
+    ).reshape(-1, 2)
+    on_surf = ((surf_pos >= 0.) & (surf_pos <= 1.)).all(axis=1)
+    return surf_pos, on_surf
+
+def surface_gaze_datums(events, timestamps, confidence, surf_pos, on_surf):
+    """
+    Builds the gaze_on_surfaces / fixations_on_surfaces dicts of a surface
+    event, with the keys of Surface.map_gaze_and_fixation_event.
+    """
+    datums = []
+    for event, ts, conf, pos, on in zip(
+        events, timestamps.tolist(), confidence.tolist(), surf_pos.tolist(), on_surf.tolist()
+    ):
+        datum = {
+            "topic": event["topic"] + "_on_surface",
+            "norm_pos": pos,
+            "confidence": conf,
+            "on_surf": on,
+            "base_data": (event["topic"], ts),
+            "timestamp": ts,
+        }
+        if event["topic"] == "fixations":
+            datum["id"] = event["id"]
+            datum["duration"] = event["duration"]
+            datum["dispersion"] = event["dispersion"]
+        datums.append(datum)
+    return datums
@@ -0,0 +1,244 @@
+"""
+Surface mapped gaze in a shared memory ring buffer.
+
+Screen_Tracker_Online writes the gaze on every surface into the ring with
+Surface_Gaze_Writer, a process on the same machine polls it with
+Surface_Gaze_Reader. There is one writer and any number of readers, no
+locks: records are written first and the total write count is published
+after them, a reader copies the records it has not seen and drops those
+the writer overwrote while it was copying.
+
+Only numpy and the standard library are needed, so a stimulus program
+can use the reader without Pupil:
+
+    reader = Surface_Gaze_Reader()
+    while running:
+        for record in reader.read():
+            surface = reader.surfaces[record['surface']]
+            ...
+
+    python surface_gaze_shm.py  # prints the gaze and the latency
+"""
+import argparse
+import sys
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+DEFAULT_NAME = 'pupil_surface_gaze'
+MAX_SURFACES = 32
+VERSION = 1
+
+HEADER_DTYPE = np.dtype([
+    ('magic', 'S4'),
+    ('version', 'u4'),
+    ('capacity', 'u8'),
+    # records written since the ring was created
+    ('write_count', 'u8'),
+    ('surface_count', 'u4'),
+    ('_pad', 'u4'),
+    ('surfaces', 'S64', (MAX_SURFACES,)),
+])
+
+RECORD_DTYPE = np.dtype([
+    ('timestamp', 'f8'),
+    ('x', 'f4'),
+    ('y', 'f4'),
+    ('confidence', 'f4'),
+    # index into the surface names of the header
+    ('surface', 'u2'),
+    ('_pad', 'u2'),
+    # time.perf_counter() of the writer, the same clock in every process
+    ('published', 'f8'),
+])
+
+def _ring_views(shm):
+    header = np.ndarray((), dtype=HEADER_DTYPE, buffer=shm.buf)
+    capacity = int(header['capacity'])
+    records = np.ndarray((capacity,), dtype=RECORD_DTYPE, buffer=shm.buf, offset=HEADER_DTYPE.itemsize)
+    return header, records
+
+# rings written by this process, the writer unregisters them itself
+_written = set()
+
+def _attach(name):
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    shm = shared_memory.SharedMemory(name=name)
+    if name not in _written:
+        # the resource tracker would unlink the writer's segment when this process exits
+        from multiprocessing import resource_tracker
+        resource_tracker.unregister(shm._name, 'shared_memory')
+    return shm
+
+class Surface_Gaze_Writer(object):
+    """
+    name : shared memory name the readers attach to
+    capacity : records kept in the ring
+    """
+    def __init__(self, name=DEFAULT_NAME, capacity=4096):
+        size = HEADER_DTYPE.itemsize + capacity * RECORD_DTYPE.itemsize
+        try:
+            self._shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        except FileExistsError:
+            # left behind by a writer that crashed
+            stale = shared_memory.SharedMemory(name=name)
+            stale.close()
+            stale.unlink()
+            self._shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        self.name = name
+        _written.add(name)
+        self._header = np.ndarray((), dtype=HEADER_DTYPE, buffer=self._shm.buf)
+        self._header[()] = np.zeros((), dtype=HEADER_DTYPE)
+        self._header['capacity'] = capacity
+        self._header['version'] = VERSION
+        self._header, self._records = _ring_views(self._shm)
+        self._surfaces = {}
+        self._count = 0
+        # readers check the magic last, the header is complete by then
+        self._header['magic'] = b'PGSR'
+
+    @property
+    def capacity(self):
+        return len(self._records)
+
+    def _surface_index(self, surface_name):
+        index = self._surfaces.get(surface_name)
+        if index is None:
+            index = len(self._surfaces)
+            if index >= MAX_SURFACES:
+                return None
+            self._header['surfaces'][index] = surface_name.encode('utf-8')[:64].decode('utf-8', 'ignore').encode('utf-8')
+            self._header['surface_count'] = index + 1
+            self._surfaces[surface_name] = index
+        return index
+
+    def publish(self, surface_name, rows):
+        """
+        rows : (n, 4) timestamp, x, y, confidence of the gaze on the surface
+        """
+        index = self._surface_index(surface_name)
+        if index is None or not len(rows):
+            return
+        rows = np.asarray(rows)[-self.capacity:]
+        n = len(rows)
+        start = self._count % self.capacity
+        first = min(n, self.capacity - start)
+        published = time.perf_counter()
+        for target, source in (
+            (self._records[start:start + first], rows[:first]),
+            (self._records[:n - first], rows[first:]),
+        ):
+            target['timestamp'] = source[:, 0]
+            target['x'] = source[:, 1]
+            target['y'] = source[:, 2]
+            target['confidence'] = source[:, 3]
+            target['surface'] = index
+            target['published'] = published
+        self._count += n
+        # one aligned 8 byte store, readers see all records before it
+        self._header['write_count'] = self._count
+
+    def close(self):
+        self._header = self._records = None
+        self._shm.close()
+        self._shm.unlink()
+        _written.discard(self.name)
+
+class Surface_Gaze_Reader(object):
+    """
+    name : shared memory name of the writer
+    from_start : also return the records in the ring before attaching
+    """
+    def __init__(self, name=DEFAULT_NAME, from_start=False):
+        self._shm = _attach(name)
+        self._header, self._records = _ring_views(self._shm)
+        if self._header['magic'] != b'PGSR' or self._header['version'] != VERSION:
+            self.close()
+            raise ValueError("{} is not a version {} surface gaze ring".format(name, VERSION))
+        count = int(self._header['write_count'])
+        self._read_count = max(0, count - self.capacity) if from_start else count
+        # records overwritten before they were read
+        self.lost = 0
+        self._surfaces = []
+
+    @property
+    def capacity(self):
+        return len(self._records)
+
+    @property
+    def surfaces(self):
+        """
+        surface names, record['surface'] indexes into them
+        """
+        count = int(self._header['surface_count'])
+        if len(self._surfaces) != count:
+            self._surfaces = [name.decode('utf-8') for name in self._header['surfaces'][:count]]
+        return self._surfaces
+
+    def read(self, copy=True):
+        """
+        returns the RECORD_DTYPE records written since the last read
+
+        With copy=False the records are views into the ring when they do
+        not wrap around, valid until the writer laps them. Use them right
+        away.
+        """
+        count = int(self._header['write_count'])
+        if count - self._read_count > self.capacity:
+            self.lost += count - self._read_count - self.capacity
+            self._read_count = count - self.capacity
+        start = self._read_count % self.capacity
+        n = count - self._read_count
+        if start + n <= self.capacity:
+            records = self._records[start:start + n]
+            if copy:
+                records = records.copy()
+        else:
+            records = np.concatenate((self._records[start:], self._records[:start + n - self.capacity]))
+
+        if copy:
+            # records the writer reached while we copied are not valid
+            overwritten = int(self._header['write_count']) - self.capacity - self._read_count
+            if overwritten > 0:
+                records = records[overwritten:]
+                self.lost += overwritten
+        self._read_count = count
+        return records
+
+    def close(self):
+        self._header = self._records = None
+        self._shm.close()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Prints the surface gaze published by Screen_Tracker_Online.')
+    parser.add_argument('--name', default=DEFAULT_NAME)
+    parser.add_argument('--interval', type=float, default=0.001, help='poll interval [s]')
+    args = parser.parse_args(argv)
+
+    reader = Surface_Gaze_Reader(args.name)
+    latencies = []
+    last_report = time.perf_counter()
+    try:
+        while True:
+            records = reader.read()
+            now = time.perf_counter()
+            latencies.extend((now - records['published']).tolist())
+            if len(records):
+                last = records[-1]
+                print('{:<20} {:.4f} {:.3f} {:.3f} {:.2f}'.format(
+                    reader.surfaces[last['surface']], last['timestamp'], last['x'], last['y'], last['confidence']))
+            if now - last_report > 1. and latencies:
+                print('latency [us] median {:.0f} p99 {:.0f}, {} lost'.format(
+                    np.median(latencies) * 1e6, np.percentile(latencies, 99) * 1e6, reader.lost))
+                latencies = []
+                last_report = now
+            time.sleep(args.interval)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        reader.close()
+
+if __name__ == '__main__':
+    main()
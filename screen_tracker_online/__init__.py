@@ -5,4 +5,6 @@ from pathlib import Path
 base_dir = Path(__file__).parents[3]
 sys.path.append(os.path.join(base_dir,'pupil_plugins_shared'))
 
-from screen_tracker import Screen_Tracker
\ No newline at end of file
+# screen_tracker is imported when the plugin is activated
+from lazy_plugin import lazy_plugin
+Screen_Tracker = lazy_plugin('screen_tracker', 'Screen_Tracker')
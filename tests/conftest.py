@@ -0,0 +1,10 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'tools'))
+
+import replay_plugins
+
+# GL is always headless_gl, Pupil's modules are replaced by the stand-ins of
+# the replay harness when they can not be imported
+replay_plugins.install_stubs([])
@@ -0,0 +1,36 @@
+import numpy as np
+
+import replay_plugins
+from calibration.accuracy_evaluation import Accuracy_Evaluator, unproject
+
+def evaluate(gaze_offset, sites=((0.25, 0.25), (0.75, 0.75))):
+    intrinsics = replay_plugins.Replay_Intrinsics((1280, 720))
+    accuracy = Accuracy_Evaluator(intrinsics)
+    timestamp = 0.
+    for site in sites:
+        for _ in range(30):
+            timestamp += 1 / 30.
+            accuracy.add_ref({'timestamp': timestamp, 'norm_pos': site}, site)
+            accuracy.add_gaze([{'timestamp': timestamp + 0.005, 'norm_pos': np.add(site, gaze_offset)}])
+            accuracy.update(timestamp)
+    return accuracy.finish(), intrinsics
+
+def test_gaze_on_the_marker_is_accurate():
+    (results, flagged), _ = evaluate((0., 0.))
+    assert results['accuracy'] < 1e-6
+    assert results['samples'] == 60
+    assert results['unmatched'] == 0
+    assert not flagged
+
+def test_offset_gaze_error_is_the_angle_to_the_marker():
+    offset = (0.01, 0.)
+    (results, _), intrinsics = evaluate(offset)
+    site = np.array([0.25, 0.25])
+    expected = np.degrees(np.arccos(np.dot(*unproject(intrinsics, [site, site + offset]))))
+    assert abs(results['sites'][0]['accuracy'] - expected) < 1e-6
+    assert results['outliers'] == 0
+
+def test_site_with_mostly_outliers_is_flagged():
+    (results, _), _ = evaluate((0.3, 0.))
+    assert results['outliers'] == results['samples']
+    assert all(site['flagged'] for site in results['sites'])
@@ -0,0 +1,31 @@
+from calibration.calibration_log import Calibration_Log_Writer, load_calibration_log
+
+def write_session(path, completed):
+    log = Calibration_Log_Writer(str(path), 'calibration')
+    log.write_ref({'timestamp': 1., 'norm_pos': (0.5, 0.5), 'screen_pos': (640., 360.)})
+    log.write_pupil({'timestamp': 1.01, 'confidence': 0.9, 'id': 1, 'norm_pos': (0.4, 0.6)})
+    log.close(completed=completed)
+
+def test_round_trip(tmp_path):
+    path = tmp_path / 'session.calibration_log'
+    write_session(path, completed=True)
+    session = load_calibration_log(str(path))
+    assert session['mode'] == 'calibration'
+    assert session['completed']
+    assert session['ref_list'] == [{'timestamp': 1., 'norm_pos': (0.5, 0.5), 'screen_pos': (640., 360.)}]
+    assert session['pupil_list'] == [{'timestamp': 1.01, 'confidence': 0.9, 'id': 1, 'norm_pos': (0.4, 0.6)}]
+
+def test_aborted_session_is_not_completed(tmp_path):
+    path = tmp_path / 'session.calibration_log'
+    write_session(path, completed=False)
+    assert not load_calibration_log(str(path))['completed']
+
+def test_cut_record_keeps_what_came_before(tmp_path):
+    path = tmp_path / 'session.calibration_log'
+    write_session(path, completed=True)
+    data = path.read_bytes()
+    path.write_bytes(data[:-3])
+    session = load_calibration_log(str(path))
+    assert len(session['ref_list']) == 1
+    assert len(session['pupil_list']) == 1
+    assert not session['completed']
@@ -0,0 +1,42 @@
+import numpy as np
+
+from calibration.calibration_samples import Calibration_Samples, Running_Stats
+
+def pupil(timestamp, eye_id=0):
+    return {'timestamp': timestamp, 'confidence': 1., 'id': eye_id, 'norm_pos': (0.5, 0.5)}
+
+def ref(timestamp):
+    return {'timestamp': timestamp, 'norm_pos': (0.5, 0.5), 'screen_pos': (640., 360.)}
+
+def test_pupils_outside_the_window_are_dropped():
+    samples = Calibration_Samples(window=1.)
+    for timestamp in np.arange(0., 10., 0.5):
+        samples.add_pupil(pupil(timestamp))
+    samples.add_ref(ref(10.))
+    samples.add_pupil(pupil(10.5))
+    samples.add_pupil(pupil(11.))
+    samples.add_pupil(pupil(13.))
+
+    kept = [datum['timestamp'] for datum in samples.pupil_list()]
+    assert kept == [9., 9.5, 10.5, 11.]
+    assert samples.dropped == 18
+    assert samples.ref_list() == [ref(10.)]
+
+def test_outside_stride_keeps_every_nth_pupil():
+    samples = Calibration_Samples(window=1., outside_stride=4)
+    for timestamp in range(20):
+        samples.add_pupil(pupil(float(timestamp)))
+    samples.add_ref(ref(20.))
+
+    kept = [datum['timestamp'] for datum in samples.pupil_list()]
+    assert kept == [3., 7., 11., 15., 19.]
+    assert samples.dropped == 15
+
+def test_running_stats_match_numpy():
+    points = np.random.default_rng(0).normal(size=(101, 2))
+    stats = Running_Stats()
+    for batch in np.array_split(points, 7):
+        stats.update(batch)
+    assert stats.n == len(points)
+    np.testing.assert_allclose(stats.mean, points.mean(axis=0))
+    np.testing.assert_allclose(stats.variance, points.var(axis=0, ddof=1))
@@ -0,0 +1,49 @@
+import types
+
+import pytest
+
+import headless_gl
+import replay_plugins
+from calibration.participant_driven_calibration import Participant_Driven_Screen_Marker_Calibration
+
+@pytest.fixture
+def plugin(tmp_path):
+    g_pool = replay_plugins.make_g_pool((1280, 720), str(tmp_path))
+    plugin = Participant_Driven_Screen_Marker_Calibration(g_pool, fullscreen=False, log_sessions=False)
+    plugin.button = types.SimpleNamespace(status_text='')
+    plugin.start()
+    yield plugin
+    plugin.stop()
+
+def counts():
+    return headless_gl.calls['glfwSwapBuffers'], headless_gl.calls['glOrtho']
+
+def test_unchanged_window_is_not_drawn_again(plugin):
+    plugin.gl_display_in_window()
+    drawn = counts()
+    for _ in range(10):
+        plugin.gl_display_in_window()
+    assert counts() == drawn
+
+def test_resize_redraws_and_sets_the_projection(plugin):
+    plugin.gl_display_in_window()
+    swaps, orthos = counts()
+    headless_gl.resize(plugin._window, 800, 600)
+    plugin.gl_display_in_window()
+    assert counts() == (swaps + 1, orthos + 1)
+    plugin.gl_display_in_window()
+    assert counts() == (swaps + 1, orthos + 1)
+
+def test_refresh_redraws_with_the_same_projection(plugin):
+    plugin.gl_display_in_window()
+    swaps, orthos = counts()
+    headless_gl.refresh(plugin._window)
+    plugin.gl_display_in_window()
+    assert counts() == (swaps + 1, orthos)
+
+def test_state_change_redraws(plugin):
+    plugin.gl_display_in_window()
+    swaps, _ = counts()
+    plugin.display_pos = (0.25, 0.75)
+    plugin.gl_display_in_window()
+    assert counts()[0] == swaps + 1
@@ -0,0 +1,24 @@
+import numpy as np
+
+from screen_detection import Screen_Identities
+
+def screen(x, y, size=100.):
+    return np.float32([[x, y], [x + size, y], [x + size, y + size], [x, y + size]])
+
+def test_ids_follow_moving_screens():
+    identities = Screen_Identities()
+    assert identities.assign([screen(0, 0), screen(500, 0)]) == [32, 33]
+    assert identities.assign([screen(505, 5), screen(5, 5)]) == [33, 32]
+
+def test_new_screen_gets_the_lowest_free_id():
+    identities = Screen_Identities()
+    identities.assign([screen(0, 0), screen(500, 0)])
+    assert identities.assign([screen(500, 0), screen(1000, 0)]) == [33, 34]
+
+def test_lost_ids_are_released():
+    identities = Screen_Identities(max_lost_frames=2)
+    identities.assign([screen(0, 0)])
+    identities.assign([])
+    identities.assign([])
+    assert identities.assign([screen(500, 0)]) == [33]
+    assert identities.assign([screen(500, 0), screen(1000, 0)]) == [33, 32]
@@ -0,0 +1,126 @@
+"""
+Measures how long Capture spends importing the plugins of this folder.
+
+Every module is imported in a fresh interpreter, so nothing is cached,
+the best of --repeats runs is reported. Plugins registered with
+lazy_plugin only load their plugin module on activation, --activate also
+measures that step.
+
+    python tools/measure_import_time.py --pupil-dir ~/pupil/pupil_src/shared_modules
+    python tools/measure_import_time.py --save import_times.json
+    python tools/measure_import_time.py --baseline import_times.json
+
+With --baseline the exit status is 1 when a module got slower than
+tolerance allows, so startup regressions show up in CI.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+PLUGINS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# module : lazy plugin class loaded by --activate
+PLUGIN_MODULES = {
+    'calibration': 'Participant_Driven_Screen_Marker_Calibration',
+    'screen_tracker_online': 'Screen_Tracker',
+}
+
+# what the plugin modules pull in, for reference
+DEPENDENCIES = ('numpy', 'cv2', 'OpenGL.GL', 'glfw', 'pyglui.ui')
+
+MEASURE = '''
+import sys, time
+sys.path[:0] = {paths!r}
+start = time.perf_counter()
+import {module}
+imported = time.perf_counter()
+if {plugin!r}:
+    getattr(sys.modules[{module!r}], {plugin!r}).load_plugin_class()
+print(imported - start, time.perf_counter() - imported)
+'''
+
+def measure(module, paths, plugin=None, repeats=5):
+    """
+    returns (import seconds, activation seconds) or the error message
+    """
+    best = None
+    for _ in range(repeats):
+        result = subprocess.run(
+            [sys.executable, '-c', MEASURE.format(paths=paths, module=module, plugin=plugin)],
+            capture_output=True, text=True,
+        )
+        if result.returncode:
+            return result.stderr.strip().splitlines()[-1]
+        times = tuple(float(t) for t in result.stdout.split())
+        best = times if best is None else tuple(min(a, b) for a, b in zip(best, times))
+    return best
+
+def slowest_imports(module, paths, count=10):
+    """
+    returns the count (cumulative seconds, name) entries of -X importtime
+    """
+    code = 'import sys; sys.path[:0] = {!r}; import {}'.format(paths, module)
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], capture_output=True, text=True)
+    entries = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        entries.append((int(cumulative_us) * 1e-6, name.strip()))
+    return sorted(entries, reverse=True)[:count]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('modules', nargs='*', help='defaults to the plugin packages and their dependencies')
+    parser.add_argument('--pupil-dir', action='append', default=[], help="Pupil's shared_modules, repeatable")
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--activate', action='store_true', help='also load the plugin class of lazy plugins')
+    parser.add_argument('--detail', action='store_true', help='list the slowest imports of every module')
+    parser.add_argument('--save', help='write the times to this json file')
+    parser.add_argument('--baseline', help='compare with times saved before')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed relative slow down')
+    parser.add_argument('--slack', type=float, default=0.005, help='allowed absolute slow down [s]')
+    args = parser.parse_args(argv)
+
+    paths = [PLUGINS_DIR] + [os.path.expanduser(p) for p in args.pupil_dir]
+    modules = args.modules or list(PLUGIN_MODULES) + list(DEPENDENCIES)
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+
+    times = {}
+    regressions = []
+    print('\t'.join(('module', 'import_ms', 'activate_ms', 'baseline_ms')))
+    for module in modules:
+        plugin = PLUGIN_MODULES.get(module) if args.activate else None
+        result = measure(module, paths, plugin, args.repeats)
+        if isinstance(result, str):
+            print('{}\tfailed: {}'.format(module, result))
+            continue
+        import_time, activate_time = result
+        times[module] = import_time
+        row = [module, '{:.1f}'.format(import_time * 1000), '{:.1f}'.format(activate_time * 1000) if plugin else '-']
+        if module in baseline:
+            row.append('{:.1f}'.format(baseline[module] * 1000))
+            if import_time > baseline[module] * (1 + args.tolerance) + args.slack:
+                regressions.append(module)
+        else:
+            row.append('-')
+        print('\t'.join(row))
+        if args.detail:
+            for cumulative, name in slowest_imports(module, paths):
+                print('\t{:.1f} ms\t{}'.format(cumulative * 1000, name))
+
+    if args.save:
+        with open(args.save, 'w') as save_file:
+            json.dump(times, save_file, indent=2, sort_keys=True)
+    if regressions:
+        print('slower than the baseline: {}'.format(', '.join(regressions)))
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
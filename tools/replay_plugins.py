@@ -0,0 +1,661 @@
+"""
+Replays world frames, pupil and gaze data through the plugins headless.
+
+Screen_Tracker_Online and Participant_Driven_Screen_Marker_Calibration get
+the events Capture would give them, frame by frame, with a stubbed g_pool
+and the GL/glfw stand-ins of calibration/headless_gl.py. Every plugin is
+replayed twice on identical input, once for timings and once with
+tracemalloc for the memory peak, and the results are compared with a
+stored baseline:
+
+    python tools/replay_plugins.py --synthetic 900 --save replay_baseline.json
+    python tools/replay_plugins.py --synthetic 900 --baseline replay_baseline.json
+
+    python tools/replay_plugins.py --recording ~/recordings/2024_01_01/000 \\
+        --pupil-dir ~/pupil/pupil_src/shared_modules \\
+        --set screen_tracker.flow_tracking=True
+
+A recording needs world.mp4, world_timestamps.npy and pupil.pldata and
+gaze.pldata. --synthetic renders a screen with the calibration marker at
+the active site instead, the same seed gives the same frames.
+
+Pupil's modules are used when they can be imported (--pupil-dir), the
+missing ones are replaced by minimal stand-ins that only keep the
+plugins running. Compare numbers taken with the same setup only.
+"""
+import argparse
+import ast
+import json
+import os
+import random
+import sys
+import tempfile
+import tracemalloc
+import types
+from time import perf_counter
+
+import cv2
+import numpy as np
+
+PLUGINS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCREEN_TRACKER_DIR = os.path.join(PLUGINS_DIR, 'screen_tracker_neon')
+PLUGINS = ('screen_tracker', 'calibration')
+
+# -- stand-ins for Pupil modules that can not be imported ---------------------
+
+def _fallback_surface_tracker():
+    class Surface_Marker(object):
+        def __init__(self, detection):
+            self.uid = 'screen:{}'.format(detection['id'])
+            self.verts_px = np.array(detection['verts'], dtype=np.float32)
+
+        @staticmethod
+        def from_square_tag_detection(detection):
+            return Surface_Marker(detection)
+
+    class Surface_Online(object):
+        """
+        maps the image to the unit square of the first marker it was defined on
+        """
+        def __init__(self, name='unknown', **kwargs):
+            self.name = name
+            self.defined = False
+            self.detected = False
+            self.gaze_history_length = 1.
+            self._uid = None
+            identity = np.eye(3)
+            self.img_to_surf_trans = self.surf_to_img_trans = identity
+            self.dist_img_to_surf_trans = self.surf_to_dist_img_trans = identity
+
+        def update_location(self, frame_index, markers, camera_model):
+            markers = {marker.uid: marker for marker in markers}
+            if self._uid is None and markers:
+                self._uid = next(iter(markers))
+                self.defined = True
+            marker = markers.get(self._uid)
+            self.detected = marker is not None
+            if self.detected:
+                verts = np.float32(marker.verts_px).reshape(4, 2)
+                unit = np.float32([[0, 1], [1, 1], [1, 0], [0, 0]])
+                self.img_to_surf_trans = cv2.getPerspectiveTransform(verts, unit)
+                self.surf_to_img_trans = np.linalg.inv(self.img_to_surf_trans)
+                self.dist_img_to_surf_trans = self.img_to_surf_trans
+                self.surf_to_dist_img_trans = self.surf_to_img_trans
+
+        def move_corner(self, corner_idx, pos, camera_model):
+            pass
+
+    class Surface_Tracker(object):
+        def __init__(self, g_pool, *args, **kwargs):
+            self.g_pool = g_pool
+            self.surfaces = []
+            self.markers = []
+            self.current_frame = None
+            self._edit_surf_verts = []
+            self._ui_heatmap_mode_selector = None
+            self.gui = types.SimpleNamespace(show_heatmap=False)
+
+        @property
+        def camera_model(self):
+            return self.g_pool.capture.intrinsics
+
+        def recent_events(self, events):
+            frame = events.get('frame')
+            self.current_frame = frame
+            if not frame:
+                return
+            self._update_markers(frame)
+            self._update_surface_locations(frame.index)
+            self._update_surface_corners()
+            events['surfaces'] = self._create_surface_events(events, frame.timestamp)
+
+        def add_surface(self, surface):
+            self.surfaces.append(surface)
+
+        def save_surface_definitions_to_file(self):
+            pass
+
+        def cleanup(self):
+            pass
+
+    return {
+        'surface_tracker': {},
+        'surface_tracker.surface_tracker': {'Surface_Tracker': Surface_Tracker},
+        'surface_tracker.surface_online': {'Surface_Online': Surface_Online},
+        'surface_tracker.surface_marker': {'Surface_Marker': Surface_Marker},
+        'surface_tracker.gui': {'Heatmap_Mode': types.SimpleNamespace(WITHIN_SURFACE=0)},
+    }
+
+def _fallback_calibration():
+    def normalize(pos, size, flip_y=False):
+        x, y = pos[0] / float(size[0]), pos[1] / float(size[1])
+        return (x, 1 - y) if flip_y else (x, y)
+
+    def denormalize(pos, size, flip_y=False):
+        x, y = pos[0] * size[0], pos[1] * size[1]
+        return (x, size[1] - y) if flip_y else (x, y)
+
+    class CircleTracker(object):
+        """
+        concentric dark and bright ellipses, like the calibration marker
+        """
+        def update(self, gray_img):
+            edges = cv2.adaptiveThreshold(gray_img, 255, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY_INV, 15, 5)
+            *_, contours, _ = cv2.findContours(edges, cv2.RETR_LIST, cv2.CHAIN_APPROX_NONE)
+            ellipses = [cv2.fitEllipse(c) for c in contours if len(c) >= 20 and cv2.contourArea(c) > 30]
+            ellipses = [e for e in ellipses if min(e[1]) > 0.8 * max(e[1])]
+            markers = []
+            for e in sorted(ellipses, key=lambda e: e[1][0]):
+                for marker in markers:
+                    if np.hypot(*np.subtract(marker['img_pos'], e[0])) < 3:
+                        marker['ellipses'].append(e)
+                        break
+                else:
+                    markers.append({'ellipses': [e], 'img_pos': e[0], 'marker_type': 'Ref'})
+            markers = [m for m in markers if len(m['ellipses']) >= 3]
+            size = gray_img.shape[::-1]
+            for marker in markers:
+                marker['norm_pos'] = normalize(marker['img_pos'], size, flip_y=True)
+            return markers
+
+    class Calibration_Plugin(object):
+        def __init__(self, g_pool):
+            self.g_pool = g_pool
+            self.active = False
+            self.mode = 'calibration'
+            self.mode_pretty = 'Calibration'
+            self.pupil_confidence_threshold = g_pool.min_data_confidence
+            self.menu = None
+            self.button = None
+
+        def start(self):
+            self.active = True
+
+        def stop(self):
+            self.active = False
+
+        def finish_accuracy_test(self, pupil_list, ref_list):
+            pass
+
+        def notify_all(self, notification):
+            pass
+
+        def init_ui(self):
+            pass
+
+        def deinit_ui(self):
+            pass
+
+    def finish_calibration(g_pool, pupil_list, ref_list):
+        pass
+
+    def interp_fn(t, b, c, d, start_sample=15., stop_sample=55.):
+        # same as Pupil's screen_marker_calibration
+        if 0 <= t < start_sample:
+            return b + (c - b) * (t / start_sample)
+        elif start_sample <= t < stop_sample:
+            return c
+        elif stop_sample <= t < d:
+            return c + (b - c) * ((t - stop_sample) / (d - stop_sample))
+        return b
+
+    return {
+        'methods': {'normalize': normalize, 'denormalize': denormalize},
+        'circle_detector': {'CircleTracker': CircleTracker},
+        'file_methods': {'load_object': lambda path: None, 'save_object': lambda obj, path: None},
+        'calibration_routines': {},
+        'calibration_routines.calibration_plugin_base': {'Calibration_Plugin': Calibration_Plugin},
+        'calibration_routines.finish_calibration': {'finish_calibration': finish_calibration},
+        'calibration_routines.screen_marker_calibration': {'interp_fn': interp_fn},
+        'plugin': {'Plugin': object},
+    }
+
+def _importable(name):
+    try:
+        __import__(name)
+    except ImportError:
+        return False
+    return True
+
+def install_stubs(pupil_dirs):
+    """
+    returns the names of the Pupil modules replaced by stand-ins
+    """
+    sys.path[:0] = [PLUGINS_DIR, SCREEN_TRACKER_DIR, os.path.join(PLUGINS_DIR, 'calibration')] + pupil_dirs
+    import headless_gl
+    headless_gl.install()
+
+    replaced = []
+    for fallback in (_fallback_surface_tracker, _fallback_calibration):
+        modules = fallback()
+        # the whole group or nothing, stand-ins and Pupil classes do not mix
+        if all(_importable(name) for name in modules):
+            continue
+        for name, attributes in modules.items():
+            module = types.ModuleType(name)
+            module.__dict__.update(attributes)
+            sys.modules[name] = module
+            replaced.append(name)
+    return replaced
+
+# -- input --------------------------------------------------------------------
+
+class Replay_Frame(object):
+    def __init__(self, img, gray, index, timestamp):
+        self.img = img
+        self.gray = gray
+        self.index = index
+        self.timestamp = timestamp
+        self.height, self.width = gray.shape
+
+def load_pldata(path):
+    """
+    returns the datums of a Pupil .pldata file and their timestamps
+    """
+    import msgpack
+    datums = []
+    with open(path, 'rb') as pldata:
+        for topic, payload in msgpack.Unpacker(pldata, raw=False, use_list=False):
+            datums.append(msgpack.unpackb(payload, raw=False, use_list=False))
+    timestamps = np.array([datum['timestamp'] for datum in datums])
+    order = np.argsort(timestamps, kind='stable')
+    return [datums[i] for i in order], timestamps[order]
+
+class Recording(object):
+    def __init__(self, rec_dir, max_frames=None):
+        self.rec_dir = rec_dir
+        self.timestamps = np.load(os.path.join(rec_dir, 'world_timestamps.npy'))[:max_frames]
+        self.pupil = load_pldata(os.path.join(rec_dir, 'pupil.pldata'))
+        self.gaze = load_pldata(os.path.join(rec_dir, 'gaze.pldata'))
+        capture = cv2.VideoCapture(os.path.join(rec_dir, 'world.mp4'))
+        self.frame_size = (int(capture.get(cv2.CAP_PROP_FRAME_WIDTH)), int(capture.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+        capture.release()
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def ticks(self, plugin_state=None):
+        """
+        yields the events of every world frame, data between the previous
+        and this frame's timestamp
+        """
+        capture = cv2.VideoCapture(os.path.join(self.rec_dir, 'world.mp4'))
+        previous = -np.inf
+        for index, timestamp in enumerate(self.timestamps):
+            ok, img = capture.read()
+            if not ok:
+                break
+            events = {'frame': Replay_Frame(img, cv2.cvtColor(img, cv2.COLOR_BGR2GRAY), index, float(timestamp))}
+            for topic, (datums, timestamps) in (('pupil', self.pupil), ('gaze', self.gaze)):
+                start, stop = np.searchsorted(timestamps, [previous, timestamp], side='right')
+                events[topic] = datums[start:stop]
+            events['pupil_positions'] = events['pupil']
+            events['fixations'] = []
+            previous = timestamp
+            yield events
+        capture.release()
+
+# screen brightness of benchmark_screen_detection.render_frame
+SCREEN_FILL = 230
+
+class Synthetic_World(object):
+    """
+    A screen in front of the world camera, 30 fps world, 200 Hz per eye
+    pupil and 120 Hz gaze. The calibration marker is drawn on the screen
+    at plugin_state()'s site, so the calibration plugin sees its own sites.
+    """
+    def __init__(self, frames, seed=0, frame_size=(1280, 720)):
+        from benchmark_screen_detection import render_frame
+        self.frames = frames
+        self.seed = seed
+        self.frame_size = frame_size
+        rng = np.random.default_rng(seed)
+        self.background, corners = render_frame(rng, frame_size, 0.05, 0., 0., 100)
+        # calibration sites have y up, the marker window keeps a border around them
+        unit = np.float32([[0, 1], [1, 1], [1, 0], [0, 0]])
+        self.screen_to_img = cv2.getPerspectiveTransform(unit, corners)
+        self.marker_radius = 0.04 * np.linalg.norm(corners[1] - corners[0])
+
+    def __len__(self):
+        return self.frames
+
+    def site_center(self, site):
+        screen_pos = 0.1 + 0.8 * np.float32(site)
+        return cv2.perspectiveTransform(screen_pos.reshape(1, 1, 2), self.screen_to_img)[0, 0]
+
+    def _draw_marker(self, img, site):
+        center = tuple(int(v) for v in self.site_center(site))
+        # the marker window is blank around the marker, clear the screen content
+        cv2.circle(img, center, int(self.marker_radius * 1.5), SCREEN_FILL, -1)
+        for scale, color in ((1., 0), (.63, 255), (.32, 0), (.05, 255)):
+            cv2.circle(img, center, max(1, int(self.marker_radius * scale)), color, -1, lineType=cv2.LINE_AA)
+
+    def ticks(self, plugin_state=None):
+        rng = np.random.default_rng(self.seed + 1)
+        for index in range(self.frames):
+            timestamp = index / 30.
+            gray = self.background.copy()
+            site = plugin_state() if plugin_state else None
+            if site is not None:
+                self._draw_marker(gray, site)
+            gray = cv2.add(gray, rng.integers(0, 4, gray.shape, dtype=np.uint8))
+            img = cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR)
+
+            pupil = [
+                {
+                    'topic': 'pupil.{}'.format(eye_id),
+                    'id': eye_id,
+                    'timestamp': timestamp - k / 200.,
+                    'confidence': 0.95,
+                    'norm_pos': tuple(rng.normal(0.5, 0.01, 2).tolist()),
+                    'method': '2d c++',
+                }
+                for k in range(7) for eye_id in (0, 1)
+            ]
+            gaze = [
+                {
+                    'topic': 'gaze.2d.01.',
+                    'timestamp': timestamp - k / 120.,
+                    'confidence': 0.9,
+                    'norm_pos': tuple(rng.normal(0.5, 0.1, 2).tolist()),
+                }
+                for k in range(4)
+            ]
+            yield {
+                'frame': Replay_Frame(img, gray, index, timestamp),
+                'pupil': pupil,
+                'pupil_positions': pupil,
+                'gaze': gaze,
+                'fixations': [],
+            }
+
+# -- plugins ------------------------------------------------------------------
+
+class Replay_Intrinsics(object):
+    """
+    Pinhole camera without distortion, stands in for
+    g_pool.capture.intrinsics. The camera matrix is the one of Pupil's
+    Dummy_Camera, so angles match a replay with Pupil's modules.
+    """
+    def __init__(self, resolution, focal_length=1000.):
+        self.resolution = resolution
+        self.K = np.array([
+            [focal_length, 0., resolution[0] / 2.],
+            [0., focal_length, resolution[1] / 2.],
+            [0., 0., 1.],
+        ])
+        self.D = np.zeros(5)
+
+    def unprojectPoints(self, pts_2d, use_distortion=True, normalize=False):
+        """
+        returns the (n, 3) rays through the image points
+        """
+        pts_2d = np.asarray(pts_2d, dtype=np.float64).reshape(-1, 1, 2)
+        rays = cv2.undistortPoints(pts_2d, self.K, self.D).reshape(-1, 2)
+        rays = np.column_stack((rays, np.ones(len(rays))))
+        if normalize:
+            rays /= np.linalg.norm(rays, axis=1)[:, None]
+        return rays
+
+    def undistort_points_on_image_plane(self, points):
+        return np.asarray(points, dtype=np.float64)
+
+    def undistort(self, img):
+        return img
+
+def make_g_pool(frame_size, user_dir):
+    try:
+        from camera_models import Dummy_Camera
+        intrinsics = Dummy_Camera(frame_size, 'replay')
+    except ImportError:
+        intrinsics = Replay_Intrinsics(frame_size)
+    capture = types.SimpleNamespace(
+        online=True,
+        frame_size=frame_size,
+        intrinsics=intrinsics,
+        source_path=None,
+    )
+    return types.SimpleNamespace(
+        app='capture',
+        process='world',
+        user_dir=user_dir,
+        capture=capture,
+        min_data_confidence=0.6,
+        get_timestamp=lambda: 0.,
+    )
+
+class Screen_Tracker_Driver(object):
+    """
+    Adds a surface on the first screen found, like a user would.
+    """
+    name = 'screen_tracker'
+
+    def __init__(self, g_pool, options):
+        from ScreenTrackerOnline import Screen_Tracker_Online
+        self.plugin = Screen_Tracker_Online(g_pool)
+        for key, value in options.items():
+            setattr(self.plugin, key, value)
+
+    def site(self):
+        return None
+
+    def before_tick(self):
+        pass
+
+    def after_tick(self):
+        if not self.plugin.surfaces and len(self.plugin.markers):
+            self.plugin.on_add_surface_click()
+
+    def problems(self):
+        """
+        returns what kept the replay from exercising the plugin
+        """
+        return [] if self.plugin.surfaces else ['no screen was found, no surface was added']
+
+    def close(self):
+        self.plugin.cleanup()
+
+class Calibration_Driver(object):
+    """
+    Presses space for every site, starts a new session when one finishes.
+    A site that is shown for more than STALL_FACTOR times its animation
+    has stalled, the marker is not found there.
+    """
+    STALL_FACTOR = 3
+    name = 'calibration'
+
+    def __init__(self, g_pool, options):
+        from calibration.participant_driven_calibration import Participant_Driven_Screen_Marker_Calibration
+        options = dict({'fullscreen': False, 'log_sessions': False}, **options)
+        self.plugin = Participant_Driven_Screen_Marker_Calibration(g_pool, **options)
+        self.plugin.button = types.SimpleNamespace(status_text='')
+        self.sessions = 0
+        self.completed = 0
+        self.stalled_sites = []
+        self._start()
+
+    def _start(self):
+        self.plugin.start()
+        self.sessions += 1
+        self._site = None
+        self._site_ticks = 0
+
+    def site(self):
+        return self.plugin.active_site if self.plugin.active else None
+
+    def before_tick(self):
+        if not self.plugin.active:
+            self.completed += self.plugin.session_completed
+            self._start()
+        if not self.plugin.space_key_was_pressed and self.plugin._window:
+            from glfw import GLFW_KEY_SPACE, GLFW_PRESS
+            self.plugin.on_window_key(self.plugin._window, GLFW_KEY_SPACE, 0, GLFW_PRESS, 0)
+
+    def after_tick(self):
+        site = self.site()
+        if site != self._site:
+            self._site = site
+            self._site_ticks = 0
+        self._site_ticks += 1
+        plugin = self.plugin
+        if self._site_ticks == self.STALL_FACTOR * (plugin.lead_in + plugin.sample_duration + plugin.lead_out):
+            self.stalled_sites.append(site)
+
+    def problems(self):
+        return ['session {} stalled at site {}, the marker is not detected there'.format(self.sessions, site)
+                for site in self.stalled_sites]
+
+    def close(self):
+        if self.plugin.active:
+            self.plugin.stop()
+        else:
+            self.completed += self.plugin.session_completed
+
+DRIVERS = {'screen_tracker': Screen_Tracker_Driver, 'calibration': Calibration_Driver}
+
+def replay(driver_class, source, options, user_dir, measure_memory=False):
+    """
+    returns the per tick latencies in seconds, the tracemalloc peak in
+    bytes above the memory in use before the plugin was created and the
+    driver
+    """
+    random.seed(0)
+    g_pool = make_g_pool(source.frame_size, user_dir)
+    if measure_memory:
+        tracemalloc.start()
+        start_memory = tracemalloc.get_traced_memory()[0]
+    driver = driver_class(g_pool, options)
+    latencies = []
+    peak = 0
+    for events in source.ticks(driver.site):
+        driver.before_tick()
+        if measure_memory:
+            tracemalloc.reset_peak()
+        start = perf_counter()
+        driver.plugin.recent_events(events)
+        latencies.append(perf_counter() - start)
+        if measure_memory:
+            peak = max(peak, tracemalloc.get_traced_memory()[1] - start_memory)
+        driver.after_tick()
+    driver.close()
+    if measure_memory:
+        tracemalloc.stop()
+    return np.array(latencies), peak, driver
+
+def summarize(latencies, peak):
+    return {
+        'frames': len(latencies),
+        'fps': len(latencies) / latencies.sum() if latencies.sum() else float('inf'),
+        'p50_ms': float(np.percentile(latencies, 50) * 1000),
+        'p90_ms': float(np.percentile(latencies, 90) * 1000),
+        'p99_ms': float(np.percentile(latencies, 99) * 1000),
+        'max_ms': float(latencies.max() * 1000),
+        'peak_mb': None if peak is None else peak / 2**20,
+    }
+
+# metric : True when larger is better
+METRICS = {'fps': True, 'p50_ms': False, 'p90_ms': False, 'p99_ms': False, 'max_ms': False, 'peak_mb': False}
+# the tail of a few hundred frames is too noisy to fail on
+COMPARED = ('fps', 'p50_ms', 'p90_ms', 'peak_mb')
+
+def compare(result, baseline, tolerance):
+    """
+    returns the metrics that are worse than baseline by more than tolerance
+    """
+    worse = []
+    for metric in COMPARED:
+        if result.get(metric) is None or baseline.get(metric) is None:
+            continue
+        larger_is_better = METRICS[metric]
+        ratio = result[metric] / baseline[metric] if baseline[metric] else 1.
+        if (ratio < 1 - tolerance) if larger_is_better else (ratio > 1 + tolerance):
+            worse.append(metric)
+    return worse
+
+def _format(value):
+    return '-' if value is None else '{:.2f}'.format(value)
+
+def parse_options(settings):
+    """
+    ['screen_tracker.flow_tracking=True'] -> {'screen_tracker': {'flow_tracking': True}}
+    """
+    options = {name: {} for name in PLUGINS}
+    for setting in settings:
+        key, equals, value = setting.partition('=')
+        plugin, _, attribute = key.partition('.')
+        if plugin not in options or not attribute or not equals:
+            raise SystemExit("--set expects plugin.attribute=value, plugin one of {}".format(', '.join(PLUGINS)))
+        try:
+            options[plugin][attribute] = ast.literal_eval(value)
+        except (ValueError, SyntaxError):
+            options[plugin][attribute] = value
+    return options
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    source_group = parser.add_mutually_exclusive_group(required=True)
+    source_group.add_argument('--recording', help='Pupil recording directory')
+    source_group.add_argument('--synthetic', type=int, metavar='FRAMES', help='render this many frames')
+    parser.add_argument('--max-frames', type=int)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--plugins', nargs='+', default=list(PLUGINS), choices=PLUGINS)
+    parser.add_argument('--pupil-dir', action='append', default=[], help="Pupil's shared_modules, repeatable")
+    parser.add_argument('--set', action='append', default=[], metavar='PLUGIN.ATTRIBUTE=VALUE')
+    parser.add_argument('--no-memory', action='store_true', help='skip the tracemalloc pass')
+    parser.add_argument('--save', help='write the results to this json file')
+    parser.add_argument('--baseline', help='compare with results saved before')
+    parser.add_argument('--tolerance', type=float, default=0.15, help='allowed relative change')
+    args = parser.parse_args(argv)
+
+    replaced = install_stubs([os.path.expanduser(p) for p in args.pupil_dir])
+    if replaced:
+        print('stand-ins for: {}'.format(', '.join(replaced)))
+    options = parse_options(args.set)
+
+    if args.recording:
+        source = Recording(os.path.expanduser(args.recording), args.max_frames)
+    else:
+        source = Synthetic_World(args.synthetic, args.seed)
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+
+    results = {}
+    regressions = []
+    problems = []
+    columns = ('plugin',) + tuple(METRICS) + ('frames',)
+    print('\t'.join(columns))
+    with tempfile.TemporaryDirectory() as user_dir:
+        for name in args.plugins:
+            latencies, _, driver = replay(DRIVERS[name], source, options[name], user_dir)
+            peak = None
+            if not args.no_memory:
+                _, peak, _ = replay(DRIVERS[name], source, options[name], user_dir, measure_memory=True)
+            result = results[name] = summarize(latencies, peak)
+            print('\t'.join([name] + [_format(result.get(m)) for m in METRICS] + [str(result['frames'])]))
+            if name == 'calibration':
+                print('  {} sessions started, {} completed'.format(driver.sessions, driver.completed))
+            # the timings of a replay that did not get through are mostly the miss path
+            problems.extend('{}: {}'.format(name, problem) for problem in driver.problems())
+            if name in baseline:
+                reference = baseline[name]
+                print('\t'.join(['  baseline'] + [_format(reference.get(m)) for m in METRICS] + [str(reference.get('frames'))]))
+                worse = compare(result, reference, args.tolerance)
+                regressions.extend('{}.{}'.format(name, metric) for metric in worse)
+
+    if args.save:
+        with open(args.save, 'w') as save_file:
+            json.dump(results, save_file, indent=2, sort_keys=True)
+    for problem in problems:
+        print(problem)
+    if regressions:
+        print('worse than the baseline: {}'.format(', '.join(regressions)))
+    # a recording may not show the screen or the marker, synthetic frames always do
+    if regressions or (problems and args.synthetic):
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())